@@ -0,0 +1,152 @@
+"""Generate travel plans in bulk from a JSONL file
+
+Each input line is a JSON object such as
+    {"id": "hoi-an-3d", "input": "3 days Hoi An, 500 USD", "history": []}
+(a bare JSON string is also accepted as the input). Each output line holds
+the id, the extracted requirements, the plan and the per-item latency.
+
+The output file doubles as the checkpoint: when it already exists, items
+that completed successfully are skipped, so an interrupted run can be
+resumed with the same command. Failed records are dropped from the file
+on resume, so every id keeps a single record once it is retried.
+
+Usage:
+    python batch_plan.py inputs.jsonl plans.jsonl --concurrency 16 --rpm 500 --tpm 200000
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Iterator, Set
+
+from planner import plan_trip
+from prompts import prompt_cache_stats
+from single_flight import single_flight_stats
+from rate_limiter import PRIORITY_BATCH, configure_rate_limits, rate_limiter_stats, request_priority
+
+
+def read_items(path: str) -> Iterator[Dict]:
+    """Read input items, numbering lines that have no id"""
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            if isinstance(item, str):
+                item = {"input": item}
+            item.setdefault("id", str(line_number))
+            item["id"] = str(item["id"])
+            yield item
+
+
+def compact_output(path: str) -> Set[str]:
+    """Keep one successful record per id in an existing output file and return those ids
+
+    Failed and truncated records are removed, since their items are
+    planned again and appended.
+    """
+    done = set()
+    if not os.path.exists(path):
+        return done
+    kept = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # Dòng cuối có thể bị cắt ngang khi tiến trình bị dừng
+                continue
+            record_id = str(record.get("id"))
+            if record.get("ok") and record_id not in done:
+                done.add(record_id)
+                kept.append(line if line.endswith("\n") else line + "\n")
+    # Ghi ra file tạm rồi thay thế để không mất checkpoint nếu bị dừng giữa chừng
+    temporary = f"{path}.tmp"
+    with open(temporary, "w", encoding="utf-8") as f:
+        f.writelines(kept)
+    os.replace(temporary, path)
+    return done
+
+
+def run_item(item: Dict, use_cache: bool) -> Dict:
+    """Plan one item, turning failures into an error record"""
+    started = time.perf_counter()
+    try:
+        # Yêu cầu của batch nhường chỗ cho các lượt chat tương tác trong cùng tiến trình
+        with request_priority(PRIORITY_BATCH):
+            result = plan_trip(item["input"], item.get("history"), use_cache=use_cache)
+    except Exception as e:
+        return {
+            "id": item["id"],
+            "input": item["input"],
+            "ok": False,
+            "error": f"{type(e).__name__}: {e}",
+            "latency_ms": round((time.perf_counter() - started) * 1000, 1)
+        }
+    requirements = dict(result["requirements"])
+    requirements.pop("original_input", None)
+    return {
+        "id": item["id"],
+        "input": item["input"],
+        "ok": result["ok"],
+        "requirements": requirements,
+        "plan": result["plan"],
+        "latency_ms": result["latency_ms"],
+        **({"trace": result["trace"]} if "trace" in result else {})
+    }
+
+
+def run_batch(input_path: str, output_path: str, concurrency: int = 8, use_cache: bool = True,
+              restart: bool = False) -> Dict:
+    """Plan every pending item with bounded concurrency and append results to output_path"""
+    if restart and os.path.exists(output_path):
+        os.remove(output_path)
+    done = compact_output(output_path)
+    pending = [item for item in read_items(input_path) if item["id"] not in done]
+
+    summary = {"skipped": len(done), "succeeded": 0, "failed": 0}
+    write_lock = threading.Lock()
+    started = time.perf_counter()
+    with open(output_path, "a", encoding="utf-8") as out, ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = [executor.submit(run_item, item, use_cache) for item in pending]
+        for future in as_completed(futures):
+            record = future.result()
+            with write_lock:
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                # Ghi ngay để checkpoint luôn cập nhật
+                out.flush()
+                summary["succeeded" if record["ok"] else "failed"] += 1
+
+    elapsed = time.perf_counter() - started
+    summary["elapsed_s"] = round(elapsed, 1)
+    processed = summary["succeeded"] + summary["failed"]
+    summary["plans_per_hour"] = round(processed / elapsed * 3600) if elapsed > 0 else 0
+    summary["prompt_cache"] = prompt_cache_stats.snapshot()
+    summary["single_flight"] = single_flight_stats()
+    summary["rate_limiter"] = rate_limiter_stats()
+    return summary
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Generate travel plans from a JSONL file of user inputs")
+    parser.add_argument("input", help="JSONL file of user inputs")
+    parser.add_argument("output", help="JSONL file for results; also used as the resume checkpoint")
+    parser.add_argument("--concurrency", type=int, default=8, help="plans generated in parallel (default 8)")
+    parser.add_argument("--rpm", type=float, default=None, help="max OpenAI requests per minute")
+    parser.add_argument("--tpm", type=float, default=None, help="max OpenAI tokens per minute")
+    parser.add_argument("--no-cache", action="store_true", help="always generate fresh plans")
+    parser.add_argument("--restart", action="store_true", help="discard existing results instead of resuming")
+    args = parser.parse_args(argv)
+
+    configure_rate_limits(args.rpm, args.tpm)
+    summary = run_batch(args.input, args.output, args.concurrency, not args.no_cache, args.restart)
+    print(json.dumps(summary), file=sys.stderr)
+    return 0 if summary["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,290 @@
+"""Local stand-in for the OpenAI chat completions and OpenWeather APIs
+
+Speaks just enough of both protocols for the app to run against it:
+- POST /v1/chat/completions: forced function calls (extract_travel_info and
+  update_travel_info),
+  plain completions and SSE streaming, each with a usage block that
+  reports cached prompt tokens for prefixes it has seen before; streams
+  asked for a leading <requirements> block start with one
+- GET /geo/1.0/direct and GET /data/2.5/forecast in OpenWeather's shape
+
+Latency and error injection are configurable so benchmarks can measure
+the app's own overhead and its behaviour under upstream failures.
+
+Usage:
+    python benchmarks/mock_server.py --port 8765 --latency-ms 300 --token-ms 5 --error-rate 0.02
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+from urllib.parse import parse_qs, urlparse
+
+KNOWN_LOCATIONS = {
+    "da nang": "Da Nang", "đà nẵng": "Da Nang", "hoi an": "Hoi An", "hội an": "Hoi An",
+    "ha long": "Ha Long", "hạ long": "Ha Long", "nha trang": "Nha Trang",
+    "phu quoc": "Phu Quoc", "phú quốc": "Phu Quoc"
+}
+COORDINATES = {
+    "Da Nang": (16.0544, 108.2022), "Hoi An": (15.8801, 108.338), "Ha Long": (20.9517, 107.0852),
+    "Nha Trang": (12.2388, 109.1967), "Phu Quoc": (10.2899, 103.984)
+}
+
+# Prompt caching kicks in at 1024 tokens and grows in 128-token steps
+CACHE_MIN_TOKENS = 1024
+CACHE_STEP_TOKENS = 128
+
+
+class MockSettings:
+    """Knobs shared by all handler threads"""
+
+    def __init__(self, latency_ms: float = 200, jitter_ms: float = 50, token_ms: float = 2,
+                 completion_tokens: int = 400, error_rate: float = 0.0, weather_latency_ms: float = 50):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.token_ms = token_ms
+        self.completion_tokens = completion_tokens
+        self.error_rate = error_rate
+        self.weather_latency_ms = weather_latency_ms
+        self.calls = Counter()
+        self.lock = threading.Lock()
+        self.prefixes = set()
+
+    def count(self, name: str):
+        with self.lock:
+            self.calls[name] += 1
+
+    def cached_tokens(self, payload: Dict) -> int:
+        """Emulate provider prompt caching: tokens of the longest prefix seen before
+
+        Like OpenAI, prefixes count from 1024 tokens in steps of 128.
+        """
+        text = json.dumps({key: payload.get(key) for key in ("functions", "messages") if payload.get(key)},
+                          ensure_ascii=False)
+        cached = 0
+        with self.lock:
+            for tokens in range(CACHE_MIN_TOKENS, len(text) // 4 + 1, CACHE_STEP_TOKENS):
+                prefix = hash(text[:tokens * 4])
+                if prefix in self.prefixes:
+                    cached = tokens
+                self.prefixes.add(prefix)
+        return cached
+
+    def delay(self, base_ms: float):
+        time.sleep(max(0.0, base_ms + random.uniform(-self.jitter_ms, self.jitter_ms)) / 1000)
+
+
+def _guess_location(text: str) -> str:
+    lowered = text.lower()
+    for name, location in KNOWN_LOCATIONS.items():
+        if name in lowered:
+            return location
+    return "Da Nang"
+
+
+def _extraction_arguments(messages: List[Dict]) -> Dict:
+    """Plausible extract_travel_info arguments for the last user message"""
+    text = messages[-1].get("content", "") if messages else ""
+    start = datetime.now().date() + timedelta(days=7)
+    return {
+        "start_date": start.isoformat(),
+        "end_date": (start + timedelta(days=2)).isoformat(),
+        "location": _guess_location(text),
+        "budget_details": {"total": 10000000, "currency": "VND"},
+        "preferences": {"activities": ["sightseeing"], "cuisine_preferences": ["local food"]},
+        "weather_check": "weather" in text.lower() or "thời tiết" in text.lower()
+    }
+
+
+def _itinerary_words(count: int) -> List[str]:
+    words = []
+    day = 1
+    while len(words) < count:
+        words.append(f"\n\nDay {day}:")
+        words.extend(["08:00", "breakfast", "at", "a", "local", "cafe,", "then", "visit", "the",
+                      "old", "town", "(2h,", "50,000", "VND)."])
+        day += 1
+    return words[:count]
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    settings: MockSettings = MockSettings()
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, payload, status: int = 200, headers: Dict = None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _maybe_fail(self) -> bool:
+        """Inject a 429 or 500 with the configured probability"""
+        if random.random() >= self.settings.error_rate:
+            return False
+        self.settings.count("injected_errors")
+        if random.random() < 0.5:
+            self._send_json({"error": {"message": "Rate limit reached", "type": "rate_limit"}}, 429,
+                            {"Retry-After": "0"})
+        else:
+            self._send_json({"error": {"message": "Internal error", "type": "server_error"}}, 500)
+        return True
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        if url.path == "/__stats":
+            return self._send_json(dict(self.settings.calls))
+        self.settings.delay(self.settings.weather_latency_ms)
+        if self._maybe_fail():
+            return
+        if url.path == "/geo/1.0/direct":
+            self.settings.count("geocode")
+            location = _guess_location(query.get("q", ""))
+            lat, lon = COORDINATES[location]
+            return self._send_json([{"name": location, "lat": lat, "lon": lon, "country": "VN"}])
+        if url.path == "/data/2.5/forecast":
+            self.settings.count("forecast")
+            start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+            entries = []
+            for step in range(40):
+                moment = start + timedelta(hours=3 * step)
+                temp = 27 + 4 * random.random()
+                entries.append({
+                    "dt": int(moment.timestamp()),
+                    "dt_txt": moment.strftime("%Y-%m-%d %H:%M:%S"),
+                    "main": {"temp": round(temp, 1), "temp_min": round(temp - 1.5, 1), "temp_max": round(temp + 1.5, 1)},
+                    "weather": [{"description": random.choice(["clear sky", "scattered clouds", "light rain"])}]
+                })
+            return self._send_json({"cod": "200", "cnt": len(entries), "list": entries})
+        self._send_json({"error": "not found"}, 404)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        if not urlparse(self.path).path.endswith("/chat/completions"):
+            return self._send_json({"error": "not found"}, 404)
+        self.settings.delay(self.settings.latency_ms)
+        if self._maybe_fail():
+            return
+
+        messages = payload.get("messages", [])
+        prompt_tokens = len(json.dumps(messages)) // 4
+        prompt_details = {"cached_tokens": min(self.settings.cached_tokens(payload), prompt_tokens)}
+        model = payload.get("model", "mock")
+
+        if payload.get("function_call") or payload.get("functions"):
+            self.settings.count("function_call")
+            name = (payload.get("function_call") or {}).get("name", "extract_travel_info")
+            if name == "update_travel_info":
+                # Chỉ trả về phần thay đổi của tin nhắn tiếp theo
+                arguments = json.dumps({"preferences": {"accommodation_type": "budget hotel"}})
+            else:
+                arguments = json.dumps(_extraction_arguments(messages), ensure_ascii=False)
+            return self._send_json({
+                "id": "mock-fc", "object": "chat.completion", "model": model,
+                "choices": [{"index": 0, "finish_reason": "function_call", "message": {
+                    "role": "assistant", "content": None,
+                    "function_call": {"name": name, "arguments": arguments}}}],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": 60,
+                          "total_tokens": prompt_tokens + 60, "prompt_tokens_details": prompt_details}
+            })
+
+        words = _itinerary_words(payload.get("max_tokens") or self.settings.completion_tokens)
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(words),
+                 "total_tokens": prompt_tokens + len(words), "prompt_tokens_details": prompt_details}
+        if not payload.get("stream"):
+            self.settings.count("completion")
+            time.sleep(len(words) * self.settings.token_ms / 1000)
+            return self._send_json({
+                "id": "mock-cmpl", "object": "chat.completion", "model": model,
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": " ".join(words).strip()}}],
+                "usage": usage
+            })
+
+        self.settings.count("stream")
+        if any("<requirements>" in (m.get("content") or "") for m in messages if m.get("role") == "system"):
+            # Chế độ một lượt gọi: khối yêu cầu JSON đứng trước lịch trình
+            block = json.dumps(_extraction_arguments(messages), ensure_ascii=False)
+            words = [f"<requirements>{block}</requirements>\n"] + words
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        for i, word in enumerate(words):
+            chunk = {"id": "mock-stream", "object": "chat.completion.chunk", "model": model,
+                     "choices": [{"index": 0, "delta": {"content": word if i == 0 else " " + word}}]}
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+            time.sleep(self.settings.token_ms / 1000)
+        if (payload.get("stream_options") or {}).get("include_usage"):
+            final = {"id": "mock-stream", "object": "chat.completion.chunk", "model": model,
+                     "choices": [], "usage": usage}
+            self.wfile.write(f"data: {json.dumps(final)}\n\n".encode("utf-8"))
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+
+class MockServer:
+    """Run the mock APIs on a background thread"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, settings: MockSettings = None):
+        self.settings = settings or MockSettings()
+        handler = type("BoundMockHandler", (MockHandler,), {"settings": self.settings})
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "MockServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock OpenAI + OpenWeather server for benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=200, help="time before the first token")
+    parser.add_argument("--jitter-ms", type=float, default=50)
+    parser.add_argument("--token-ms", type=float, default=2, help="delay per generated token")
+    parser.add_argument("--completion-tokens", type=int, default=400)
+    parser.add_argument("--weather-latency-ms", type=float, default=50)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 429/500")
+    args = parser.parse_args()
+
+    settings = MockSettings(args.latency_ms, args.jitter_ms, args.token_ms, args.completion_tokens,
+                            args.error_rate, args.weather_latency_ms)
+    server = MockServer(args.host, args.port, settings)
+    print(f"Mock APIs listening on {server.url}")
+    print(f"  OPENAI_API_BASE={server.url}/v1  WEATHER_API_BASE={server.url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
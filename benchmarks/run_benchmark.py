@@ -0,0 +1,333 @@
+"""End-to-end latency benchmark against the local mock APIs
+
+Simulates N concurrent chat sessions, each sending a few turns, and times
+every stage of a turn: requirement extraction, weather, hotel lookup,
+prompt building, plan generation (time to first token and total) and
+rendering of the conversation by the Streamlit script. With --trip-state
+each session keeps a trip state like the app does: the first turn
+describes a trip and later turns edit it (through update_trip_state and
+stream_trip_plan), so delta extraction and partial plan revision are timed.
+Results are written as JSON with sorted keys so two runs can be diffed
+directly.
+
+Usage:
+    python benchmarks/run_benchmark.py --sessions 20 --turns 3 --output bench.json
+    python benchmarks/run_benchmark.py --trip-state --turns 5 --output bench-trip.json
+    python benchmarks/run_benchmark.py --compare bench.json --output bench-new.json
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from mock_server import MockServer, MockSettings  # noqa: E402
+
+DEFAULT_INPUTS = [
+    "Da Nang 2025-07-01 to 2025-07-05, 10 triệu VND",
+    "3 ngày 2 đêm ở Hội An từ ngày mai, ngân sách 8tr, xem thời tiết giúp mình",
+    "I want a relaxing beach trip to Nha Trang next week for 4 days, budget $600, I love seafood",
+    "Plan a week in Phu Quoc from July 10 with 1500 USD and check the weather",
+    "Ha Long bay 1-3/8 budget 10tr5",
+    "Make it cheaper and add more street food"
+]
+
+# Các lượt chỉnh sửa sau tin nhắn đầu tiên khi chạy với --trip-state
+TRIP_EDITS = [
+    "Make it 6 days",
+    "đổi ngân sách thành 12 triệu",
+    "Switch to Hoi An",
+    "Any tips on local etiquette?",
+    "dời sang 10/7",
+    "Add more street food"
+]
+
+STAGES = ("extraction", "weather", "hotels", "prompt", "ttft", "generation", "turn", "render")
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(values: List[float]) -> Dict:
+    return {
+        "count": len(values),
+        "mean_ms": round(sum(values) / len(values), 2) if values else 0.0,
+        "p50_ms": round(percentile(values, 50), 2),
+        "p95_ms": round(percentile(values, 95), 2),
+        "p99_ms": round(percentile(values, 99), 2),
+        "max_ms": round(max(values), 2) if values else 0.0
+    }
+
+
+class Timings:
+    """Thread-safe collection of per-stage samples in milliseconds"""
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.errors = 0
+        self.extraction_paths = Counter()
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, seconds: float):
+        with self._lock:
+            self.samples[stage].append(seconds * 1000)
+
+    def error(self):
+        with self._lock:
+            self.errors += 1
+
+    def path(self, name: str):
+        with self._lock:
+            self.extraction_paths[name] += 1
+
+
+def run_turn(planner, user_input: str, history: List[Dict], timings: Timings, use_cache: bool) -> str:
+    """Run one chat turn stage by stage, recording how long each stage takes"""
+    turn_started = time.perf_counter()
+
+    if planner.SINGLE_ROUND_TRIP:
+        # Một lượt gọi duy nhất: chỉ đo được TTFT, thời gian sinh và cả lượt
+        chunks = []
+        for chunk in planner.MergedPlanStream(user_input, history, use_cache=use_cache):
+            if not chunks:
+                timings.add("ttft", time.perf_counter() - turn_started)
+            chunks.append(chunk)
+        timings.add("generation", time.perf_counter() - turn_started)
+        timings.add("turn", time.perf_counter() - turn_started)
+        return "".join(chunks)
+
+    started = time.perf_counter()
+    requirements = planner.get_travel_requirements(user_input, history)
+    timings.add("extraction", time.perf_counter() - started)
+
+    started = time.perf_counter()
+    weather_info = planner.get_plan_weather(requirements)
+    timings.add("weather", time.perf_counter() - started)
+
+    lang = planner.detect_language(user_input)
+    started = time.perf_counter()
+    hotels = planner.get_trip_hotel_recommendations(requirements, lang)
+    timings.add("hotels", time.perf_counter() - started)
+
+    started = time.perf_counter()
+    messages = planner.build_travel_plan_messages(requirements, history, weather_info, hotels)
+    timings.add("prompt", time.perf_counter() - started)
+
+    started = time.perf_counter()
+    chunks = []
+    for chunk in planner.stream_travel_plan(requirements, history, use_cache=use_cache, messages=messages):
+        if not chunks:
+            timings.add("ttft", time.perf_counter() - started)
+        chunks.append(chunk)
+    timings.add("generation", time.perf_counter() - started)
+
+    timings.add("turn", time.perf_counter() - turn_started)
+    return "".join(chunks)
+
+
+def run_trip_turn(planner, state, user_input: str, history: List[Dict], timings: Timings, use_cache: bool) -> str:
+    """Run one turn against the session's trip state, as the app does"""
+    turn_started = time.perf_counter()
+    requirements = planner.update_trip_state(state, user_input, history)
+    timings.add("extraction", time.perf_counter() - turn_started)
+    timings.path((requirements.get('extraction') or {}).get('path', 'unknown'))
+
+    # Thời tiết, khách sạn và prompt nằm trong stream_trip_plan (chỉ tính lại khi đầu vào đổi)
+    started = time.perf_counter()
+    chunks = []
+    for chunk in planner.stream_trip_plan(state, history, use_cache=use_cache):
+        if not chunks:
+            timings.add("ttft", time.perf_counter() - started)
+        chunks.append(chunk)
+    timings.add("generation", time.perf_counter() - started)
+
+    timings.add("turn", time.perf_counter() - turn_started)
+    return "".join(chunks)
+
+
+def run_session(planner, session_id: int, turns: int, inputs: List[str], timings: Timings,
+                use_cache: bool, trip_state: bool = False) -> List[Dict]:
+    """Simulate one chat session and return its conversation"""
+    history: List[Dict] = []
+    state = planner.TripState() if trip_state else None
+    for turn in range(turns):
+        user_input = inputs[(session_id + turn) % len(inputs)]
+        if trip_state and turn:
+            user_input = TRIP_EDITS[(session_id + turn - 1) % len(TRIP_EDITS)]
+        try:
+            if trip_state:
+                plan = run_trip_turn(planner, state, user_input, history, timings, use_cache)
+            else:
+                plan = run_turn(planner, user_input, history, timings, use_cache)
+        except Exception as e:
+            print(f"Session {session_id} turn {turn} failed: {e}", file=sys.stderr)
+            timings.error()
+            continue
+        if plan == planner.PLAN_ERROR_MESSAGE:
+            timings.error()
+        history = history + [{"role": "user", "content": user_input}, {"role": "assistant", "content": plan}]
+    return history
+
+
+def time_render(conversations: List[List[Dict]], timings: Timings):
+    """Time one rerun of app.py with each conversation already in the session"""
+    try:
+        from streamlit.testing.v1 import AppTest
+    except ImportError:
+        print("streamlit is not installed; skipping the render stage", file=sys.stderr)
+        return
+    from conversation_store import get_conversation_store
+    store = get_conversation_store()
+    for i, conversation in enumerate(conversations):
+        session_id = f"benchmark-{i}"
+        store.append(session_id, conversation)
+        app = AppTest.from_file(os.path.join(ROOT, "app.py"), default_timeout=60)
+        app.session_state["session_id"] = session_id
+        started = time.perf_counter()
+        app.run()
+        timings.add("render", time.perf_counter() - started)
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(previous: Dict, current: Dict):
+    """Print p50/p95 changes per stage against a previous result file"""
+    print(f"{'stage':<12}{'p50 before':>12}{'p50 after':>12}{'p95 before':>12}{'p95 after':>12}")
+    for stage in STAGES:
+        before = previous.get("stages", {}).get(stage)
+        after = current["stages"].get(stage)
+        if not before or not after:
+            continue
+        print(f"{stage:<12}{before['p50_ms']:>12}{after['p50_ms']:>12}{before['p95_ms']:>12}{after['p95_ms']:>12}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the travel planner against mock APIs")
+    parser.add_argument("--sessions", type=int, default=10, help="concurrent simulated chat sessions")
+    parser.add_argument("--turns", type=int, default=3, help="turns per session")
+    parser.add_argument("--inputs", help="JSONL file of user inputs (strings or {\"input\": ...})")
+    parser.add_argument("--latency-ms", type=float, default=200, help="mock time to first token")
+    parser.add_argument("--token-ms", type=float, default=2, help="mock delay per generated token")
+    parser.add_argument("--completion-tokens", type=int, default=400)
+    parser.add_argument("--weather-latency-ms", type=float, default=50)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--mock-url", help="use an already running mock server instead of starting one")
+    parser.add_argument("--use-plan-cache", action="store_true", help="allow plan cache hits (off by default)")
+    parser.add_argument("--trip-state", action="store_true",
+                        help="keep a trip state per session and send edits after the first turn")
+    parser.add_argument("--skip-render", action="store_true", help="do not time Streamlit reruns")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", help="previous result file to compare against")
+    args = parser.parse_args(argv)
+
+    server = None
+    if args.mock_url:
+        base_url = args.mock_url.rstrip("/")
+    else:
+        settings = MockSettings(args.latency_ms, args.latency_ms / 4, args.token_ms, args.completion_tokens,
+                                args.error_rate, args.weather_latency_ms)
+        server = MockServer(settings=settings).start()
+        base_url = server.url
+
+    # Cấu hình phải được đặt trước khi import planner vì config đọc biến môi trường lúc import
+    os.environ["OPENAI_API_BASE"] = f"{base_url}/v1"
+    os.environ["WEATHER_API_BASE"] = base_url
+    os.environ.setdefault("OPENAI_API_KEY", "mock-key")
+    os.environ.setdefault("WEATHER_API_KEY", "mock-key")
+    os.environ["CACHE_DB_PATH"] = ""
+    os.environ["CONVERSATION_DB_PATH"] = ""
+    # Luồng làm nóng dự báo chạy nền sẽ làm lệch số lần gọi API thời tiết
+    os.environ.setdefault("WEATHER_WARMER_ENABLED", "false")
+    import planner
+    from prompts import prompt_cache_stats
+    from rate_limiter import rate_limiter_stats
+    from single_flight import single_flight_stats
+
+    inputs = DEFAULT_INPUTS
+    if args.inputs:
+        with open(args.inputs, encoding="utf-8") as f:
+            inputs = [json.loads(line) for line in f if line.strip()]
+            inputs = [item["input"] if isinstance(item, dict) else item for item in inputs]
+
+    timings = Timings()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.sessions) as executor:
+        futures = [executor.submit(run_session, planner, i, args.turns, inputs, timings, args.use_plan_cache,
+                                   args.trip_state)
+                   for i in range(args.sessions)]
+        conversations = [future.result() for future in futures]
+    wall_clock = time.perf_counter() - started
+
+    if not args.skip_render:
+        time_render(conversations, timings)
+
+    upstream_calls = {}
+    if server is not None:
+        upstream_calls = dict(server.settings.calls)
+        server.stop()
+
+    turns = len(timings.samples["turn"])
+    result = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "sessions": args.sessions,
+            "turns_per_session": args.turns,
+            "mock": {"latency_ms": args.latency_ms, "token_ms": args.token_ms,
+                     "completion_tokens": args.completion_tokens,
+                     "weather_latency_ms": args.weather_latency_ms, "error_rate": args.error_rate},
+            "plan_cache": args.use_plan_cache,
+            "single_round_trip": planner.SINGLE_ROUND_TRIP and not args.trip_state,
+            "trip_state": args.trip_state
+        },
+        "stages": {stage: summarize(timings.samples[stage]) for stage in STAGES if timings.samples[stage]},
+        "turns_completed": turns,
+        "errors": timings.errors,
+        "extraction_paths": dict(timings.extraction_paths),
+        "wall_clock_s": round(wall_clock, 2),
+        "turns_per_second": round(turns / wall_clock, 2) if wall_clock else 0.0,
+        "upstream_calls": upstream_calls,
+        "prompt_cache": prompt_cache_stats.snapshot(),
+        "single_flight": single_flight_stats(),
+        "rate_limiter": rate_limiter_stats()
+    }
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2, sort_keys=True)
+        f.write("\n")
+    print(json.dumps(result["stages"]["turn"] if turns else {}, sort_keys=True))
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(json.load(f), result)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,158 @@
+"""Cold start and rerun overhead of the Streamlit script
+
+Each run starts a fresh Python process that imports Streamlit's test
+harness first (a real server already has Streamlit loaded), then times the
+first execution of app.py - module imports, config, catalogs and clients
+included - and a number of warm reruns with a seeded conversation. The
+peak RSS growth and the number of modules loaded by the first run are
+recorded too. No API is called: the script is only rendered.
+
+Usage:
+    python benchmarks/startup_benchmark.py --runs 5 --output startup.json
+    python benchmarks/startup_benchmark.py --compare startup.json --output startup-new.json
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Dict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from run_benchmark import git_revision, summarize  # noqa: E402
+
+# Cặp hỏi - đáp dùng để tạo sẵn lịch sử hội thoại cho các lần rerun
+SEED_TURN = [
+    {"role": "user", "content": "Da Nang 2025-07-01 to 2025-07-05, 10 triệu VND"},
+    {"role": "assistant", "content": "\n\n".join(
+        f"Day {day}\n- Morning: beach walk\n- Afternoon: local market\n- Evening: seafood dinner\nTotal: 1,500,000 VND"
+        for day in range(1, 6)
+    )}
+]
+
+
+def peak_rss_mb() -> float:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux báo KB, macOS báo byte
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def worker(reruns: int, history_turns: int) -> Dict:
+    """Time app.py in this (fresh) process; returns the raw samples"""
+    sys.path.insert(0, ROOT)
+    from streamlit.testing.v1 import AppTest
+
+    modules_before = len(sys.modules)
+    rss_before = peak_rss_mb()
+    app = AppTest.from_file(os.path.join(ROOT, "app.py"), default_timeout=60)
+    started = time.perf_counter()
+    app.run()
+    first_run = time.perf_counter() - started
+    result = {
+        "first_run_ms": first_run * 1000,
+        "modules_loaded": len(sys.modules) - modules_before,
+        "rss_growth_mb": peak_rss_mb() - rss_before,
+        "errors": len(app.exception)
+    }
+
+    from conversation_store import get_conversation_store
+    get_conversation_store().append("startup-benchmark", SEED_TURN * history_turns)
+    app.session_state["session_id"] = "startup-benchmark"
+    samples = []
+    for _ in range(reruns):
+        started = time.perf_counter()
+        app.run()
+        samples.append((time.perf_counter() - started) * 1000)
+    result["rerun_ms"] = samples
+    result["errors"] += len(app.exception)
+    return result
+
+
+def run_worker(args) -> Dict:
+    env = dict(os.environ)
+    env.update({
+        # Không gọi API thật và không ghi file: chỉ đo phần khởi động và vẽ giao diện
+        "OPENAI_API_KEY": env.get("OPENAI_API_KEY", "mock-key"),
+        "WEATHER_WARMER_ENABLED": "false",
+        "CACHE_DB_PATH": "",
+        "CONVERSATION_DB_PATH": ""
+    })
+    completed = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--worker", "--reruns", str(args.reruns),
+         "--history-turns", str(args.history_turns)],
+        env=env, capture_output=True, text=True, check=True
+    )
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def compare(previous: Dict, current: Dict):
+    """Print the changes against a previous result file"""
+    print(f"{'metric':<20}{'before':>12}{'after':>12}")
+    for name in ("cold_start", "rerun"):
+        for stat in ("p50_ms", "p95_ms"):
+            before = previous.get(name, {}).get(stat)
+            after = current[name].get(stat)
+            if before is not None:
+                print(f"{name + ' ' + stat:<20}{before:>12}{after:>12}")
+    for name in ("rss_growth_mb", "modules_loaded"):
+        if name in previous:
+            print(f"{name:<20}{previous[name]:>12}{current[name]:>12}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark cold start and rerun overhead of app.py")
+    parser.add_argument("--runs", type=int, default=5, help="fresh processes to start")
+    parser.add_argument("--reruns", type=int, default=20, help="warm reruns timed per process")
+    parser.add_argument("--history-turns", type=int, default=10, help="conversation turns seeded before the reruns")
+    parser.add_argument("--output", default="startup_results.json")
+    parser.add_argument("--compare", help="previous result file to compare against")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        print(json.dumps(worker(args.reruns, args.history_turns)))
+        return 0
+
+    try:
+        samples = [run_worker(args) for _ in range(args.runs)]
+    except subprocess.CalledProcessError as e:
+        print(f"Startup run failed:\n{e.stderr}", file=sys.stderr)
+        return 1
+
+    result = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "runs": args.runs,
+            "reruns_per_run": args.reruns,
+            "history_turns": args.history_turns
+        },
+        "cold_start": summarize([sample["first_run_ms"] for sample in samples]),
+        "rerun": summarize([ms for sample in samples for ms in sample["rerun_ms"]]),
+        "rss_growth_mb": round(statistics.median(sample["rss_growth_mb"] for sample in samples), 1),
+        "modules_loaded": int(statistics.median(sample["modules_loaded"] for sample in samples)),
+        "errors": sum(sample["errors"] for sample in samples)
+    }
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2, sort_keys=True)
+        f.write("\n")
+    print(json.dumps({"cold_start": result["cold_start"], "rerun": result["rerun"]}, sort_keys=True))
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(json.load(f), result)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
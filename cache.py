@@ -0,0 +1,111 @@
+"""In-memory TTL + LRU cache with optional SQLite persistence"""
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries expire after a time-to-live
+
+    Values must be JSON-serializable so they can be written to SQLite.
+    When db_path is set, entries survive process restarts: a miss in
+    memory falls through to the database and promotes the entry back.
+    A ttl of None keeps entries until they are evicted.
+    """
+
+    def __init__(self, name: str, maxsize: int = 1024, ttl: Optional[float] = None,
+                 db_path: str = ""):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False, timeout=10)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS cache_entries ("
+                "namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, "
+                "expires_at REAL, PRIMARY KEY (namespace, key))"
+            )
+            self._db.commit()
+
+    def _expiry(self) -> Optional[float]:
+        return time.time() + self.ttl if self.ttl is not None else None
+
+    def _remember(self, key: str, value: Any, expires_at: Optional[float]):
+        self._entries[key] = (value, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached value for key, or None if missing or expired"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at is None or expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT value, expires_at FROM cache_entries WHERE namespace = ? AND key = ?",
+                    (self.name, key)
+                ).fetchone()
+                if row is not None:
+                    if row[1] is None or row[1] > now:
+                        value = json.loads(row[0])
+                        self._remember(key, value, row[1])
+                        self.hits += 1
+                        return value
+                    self._db.execute(
+                        "DELETE FROM cache_entries WHERE namespace = ? AND key = ?",
+                        (self.name, key)
+                    )
+                    self._db.commit()
+
+            self.misses += 1
+            return None
+
+    def set(self, key: str, value: Any):
+        """Store value under key"""
+        expires_at = self._expiry()
+        with self._lock:
+            self._remember(key, value, expires_at)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO cache_entries (namespace, key, value, expires_at) "
+                    "VALUES (?, ?, ?, ?)",
+                    (self.name, key, json.dumps(value, ensure_ascii=False), expires_at)
+                )
+                self._db.commit()
+
+    def clear(self):
+        """Remove all entries, including persisted ones"""
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM cache_entries WHERE namespace = ?", (self.name,))
+                self._db.commit()
+
+    def stats(self) -> Dict:
+        """Return hit/miss counters and current size"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "name": self.name,
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0
+            }
@@ -0,0 +1,115 @@
+"""Application settings loaded from the environment"""
+import json
+import os
+
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+
+def env_flag(name: str, default: bool) -> bool:
+    """Read a boolean setting such as "true"/"false" or "1"/"0" from the environment"""
+    value = os.getenv(name)
+    if value is None or value == "":
+        return default
+    return value.strip().lower() not in ("0", "false", "no", "off")
+
+
+# API settings
+API_KEY = os.getenv("OPENAI_API_KEY")
+API_BASE = os.getenv("OPENAI_API_BASE")
+WEATHER_API_KEY = os.getenv("WEATHER_API_KEY")
+WEATHER_API_BASE = os.getenv("WEATHER_API_BASE", "https://api.openweathermap.org")
+
+# Stream the generated plan into the chat instead of waiting for the full completion
+STREAM_RESPONSES = env_flag("STREAM_RESPONSES", True)
+
+# Parse plainly stated requirements locally before falling back to function calling
+LOCAL_EXTRACTION = env_flag("LOCAL_EXTRACTION", True)
+
+# Extract requirements and generate the plan in one completion when local rules are not enough
+SINGLE_ROUND_TRIP = env_flag("SINGLE_ROUND_TRIP", False)
+
+# Edit the previous plan day by day when a follow-up only changes some details
+PARTIAL_REVISION = env_flag("PARTIAL_REVISION", True)
+
+# Generate long itineraries as concurrent requests of a few days each (0 = never)
+PARALLEL_PLAN_MIN_DAYS = int(os.getenv("PARALLEL_PLAN_MIN_DAYS", "0"))
+PARALLEL_PLAN_DAYS_PER_REQUEST = int(os.getenv("PARALLEL_PLAN_DAYS_PER_REQUEST", "2"))
+PARALLEL_PLAN_WORKERS = int(os.getenv("PARALLEL_PLAN_WORKERS", "8"))
+
+# HTTP client: timeouts (giây), retries and connections kept alive per host
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "60"))
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "3"))
+HTTP_BACKOFF_FACTOR = float(os.getenv("HTTP_BACKOFF_FACTOR", "0.5"))
+HTTP_BACKOFF_MAX = float(os.getenv("HTTP_BACKOFF_MAX", "20"))
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "20"))
+
+# Process-wide governor in front of the OpenAI endpoint: per-minute budgets (0 = unlimited)
+OPENAI_RPM = float(os.getenv("OPENAI_RPM", "0"))
+OPENAI_TPM = float(os.getenv("OPENAI_TPM", "0"))
+# Concurrent OpenAI requests, adjusted between these bounds from 429s and latency
+OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", "32"))
+OPENAI_MIN_CONCURRENCY = int(os.getenv("OPENAI_MIN_CONCURRENCY", "2"))
+# Time to first byte of streamed completions above which concurrency is lowered (giây, 0 = ignore latency)
+OPENAI_LATENCY_TARGET = float(os.getenv("OPENAI_LATENCY_TARGET", "8"))
+# Times a request still rejected with 429 is queued again before giving up
+OPENAI_RATE_LIMIT_RETRIES = int(os.getenv("OPENAI_RATE_LIMIT_RETRIES", "3"))
+
+# Optional SQLite file shared by the persistent caches (empty = memory only)
+CACHE_DB_PATH = os.getenv("CACHE_DB_PATH", "")
+
+# Conversation store: SQLite log of every chat, with only recent messages kept in memory
+CONVERSATION_DB_PATH = os.getenv(
+    "CONVERSATION_DB_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "conversations.db")
+)
+# Recent messages kept in memory per session (also the history passed to the planner)
+CONVERSATION_WINDOW = int(os.getenv("CONVERSATION_WINDOW", "20"))
+# Sessions whose recent messages stay in memory before the least recently active is evicted
+CONVERSATION_MAX_SESSIONS = int(os.getenv("CONVERSATION_MAX_SESSIONS", "500"))
+# Messages drawn per page of chat history
+CHAT_PAGE_SIZE = int(os.getenv("CHAT_PAGE_SIZE", "10"))
+
+# Weather cache: forecasts are refreshed by OpenWeather every few hours
+WEATHER_CACHE_TTL = int(os.getenv("WEATHER_CACHE_TTL", str(3 * 60 * 60)))
+WEATHER_CACHE_SIZE = int(os.getenv("WEATHER_CACHE_SIZE", "256"))
+# Decimal places kept when rounding coordinates for the forecast cache key (~1 km)
+WEATHER_COORD_PRECISION = int(os.getenv("WEATHER_COORD_PRECISION", "2"))
+
+# Forecast warmer: keep catalog destinations and recently requested places refreshed in the background
+WEATHER_WARMER_ENABLED = env_flag("WEATHER_WARMER_ENABLED", True)
+WEATHER_WARM_REFRESH = int(os.getenv("WEATHER_WARM_REFRESH", str(WEATHER_CACHE_TTL * 2 // 3)))
+# Oldest warm forecast still served while refreshes keep failing
+WEATHER_WARM_MAX_AGE = int(os.getenv("WEATHER_WARM_MAX_AGE", str(WEATHER_CACHE_TTL * 2)))
+WEATHER_WARM_RECENT = int(os.getenv("WEATHER_WARM_RECENT", "20"))
+WEATHER_WARM_CONCURRENCY = int(os.getenv("WEATHER_WARM_CONCURRENCY", "4"))
+
+# Plan cache: identical normalized requirements reuse an earlier plan
+PLAN_CACHE_ENABLED = env_flag("PLAN_CACHE_ENABLED", True)
+PLAN_CACHE_TTL = int(os.getenv("PLAN_CACHE_TTL", str(24 * 60 * 60)))
+PLAN_CACHE_SIZE = int(os.getenv("PLAN_CACHE_SIZE", "512"))
+
+# Hotel catalog: columnar JSON or SQLite file
+HOTEL_CATALOG_PATH = os.getenv(
+    "HOTEL_CATALOG_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "hotels.json")
+)
+
+# Đơn vị tiền tệ trên 1 USD, dùng để quy đổi giá khách sạn theo ngân sách
+EXCHANGE_RATES = {"USD": 1.0, "VND": 25000.0, "EUR": 0.92}
+EXCHANGE_RATES.update(json.loads(os.getenv("EXCHANGE_RATES", "{}")))
+
+# History token budgets per call type; older plans are replaced by short summaries
+CONTEXT_TOKENS_EXTRACTION = int(os.getenv("CONTEXT_TOKENS_EXTRACTION", "600"))
+CONTEXT_TOKENS_PLAN = int(os.getenv("CONTEXT_TOKENS_PLAN", "2500"))
+SUMMARY_MAX_TOKENS = int(os.getenv("SUMMARY_MAX_TOKENS", "150"))
+
+# Tracing: per-stage spans, token usage and metrics (no overhead when disabled)
+TRACING_ENABLED = env_flag("TRACING_ENABLED", False)
+# Log each finished trace as one JSON line on stderr
+TRACE_LOG_JSON = env_flag("TRACE_LOG_JSON", False)
+# Serve Prometheus metrics on this port (0 = off)
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+# Ask for the usage block at the end of streamed completions
+OPENAI_STREAM_USAGE = env_flag("OPENAI_STREAM_USAGE", True)
@@ -0,0 +1,181 @@
+"""Fit conversation history into a token budget before it is sent to the model
+
+Previous assistant replies are full multi-day itineraries, so sending the
+last few messages verbatim makes every turn more expensive than the one
+before. Here user turns are kept verbatim, older plans are replaced by
+short extractive summaries (computed once per message and cached), and the
+newest messages that fit the budget of the call type are kept.
+"""
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional
+
+from config import CONTEXT_TOKENS_EXTRACTION, CONTEXT_TOKENS_PLAN, SUMMARY_MAX_TOKENS
+from rate_limiter import CHARS_PER_TOKEN
+
+# Token budget for the history part of the prompt, per call type
+CONTEXT_BUDGETS = {
+    "extraction": CONTEXT_TOKENS_EXTRACTION,
+    "plan": CONTEXT_TOKENS_PLAN
+}
+
+# Overhead of the role and separators around each chat message
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# Dòng tiêu đề ngày hoặc dòng tổng chi phí trong lịch trình
+DAY_HEADING = re.compile(r"^\W*(day|ngày)\s*\d+", re.IGNORECASE)
+SUMMARY_LINE = re.compile(r"^\s*#|\b(total|tổng)\b", re.IGNORECASE)
+
+SUMMARY_PREFIX = "(Summary of an earlier plan)"
+
+# Số kết quả được nhớ, theo băm của văn bản thay vì toàn bộ văn bản
+TOKEN_COUNT_CACHE_SIZE = 4096
+SUMMARY_CACHE_SIZE = 1024
+
+
+class _DigestCache:
+    """Bounded LRU keyed by a 16-byte BLAKE2 digest of the text, so whole messages are not kept alive"""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[tuple, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, text: str, compute: Callable[[], Any], *extra) -> Any:
+        key = (hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest(),) + extra
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+        value = compute()
+        with self._lock:
+            self._entries[key] = value
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return value
+
+
+_token_counts = _DigestCache(TOKEN_COUNT_CACHE_SIZE)
+_summaries = _DigestCache(SUMMARY_CACHE_SIZE)
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    # tiktoken chậm khi import nên chỉ nạp lúc cần đếm token lần đầu
+    try:
+        import tiktoken
+    except ImportError:  # pragma: no cover - optional dependency
+        return None
+    try:
+        return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        # Không tải được bảng mã (ví dụ: không có mạng) thì dùng ước lượng theo ký tự
+        print(f"Token encoding unavailable, estimating from length: {e}")
+        return None
+
+
+def _count_tokens(text: str) -> int:
+    encoding = _encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def count_tokens(text: str) -> int:
+    """Count tokens with tiktoken when installed, otherwise estimate from the length
+
+    Counts are cached by a digest of the text, so the cache does not keep
+    whole conversations alive.
+    """
+    return _token_counts.get_or_compute(text, lambda: _count_tokens(text))
+
+
+def message_tokens(message: Dict) -> int:
+    return count_tokens(message.get("content") or "") + MESSAGE_OVERHEAD_TOKENS
+
+
+def _truncate(text: str, max_tokens: int) -> str:
+    tokens = count_tokens(text)
+    if tokens <= max_tokens:
+        return text
+    # Cắt theo tỷ lệ rồi thu nhỏ dần cho tới khi vừa ngân sách; các lần thử không được cache
+    limit = max(1, len(text) * max_tokens // max(tokens, 1))
+    while limit > 1 and _count_tokens(text[:limit] + "…") > max_tokens:
+        limit = limit * 9 // 10
+    return text[:limit].rstrip() + "…"
+
+
+def summarize_plan(content: str, max_tokens: int = SUMMARY_MAX_TOKENS) -> str:
+    """Compact extractive summary of an assistant reply: day headings and totals
+
+    Summaries are cached by a digest of the reply, like token counts.
+    """
+    return _summaries.get_or_compute(content, lambda: _summarize_plan(content, max_tokens), max_tokens)
+
+
+def _summarize_plan(content: str, max_tokens: int) -> str:
+    lines = [line.strip() for line in content.splitlines() if line.strip()]
+    selected = []
+    for i, line in enumerate(lines):
+        if DAY_HEADING.match(line):
+            # Tiêu đề ngày ngắn thì ghép thêm hoạt động đầu tiên
+            if len(line) < 20 and i + 1 < len(lines):
+                line = f"{line} {lines[i + 1]}"
+            selected.append(line)
+        elif SUMMARY_LINE.search(line):
+            selected.append(line)
+    if not selected:
+        selected = lines[:3]
+    summary = SUMMARY_PREFIX + "\n" + "\n".join(line[:120] for line in selected)
+    return _truncate(summary, max_tokens)
+
+
+def fit_history(history: Optional[List[Dict]], call_type: str = "plan",
+                budget: Optional[int] = None) -> List[Dict]:
+    """Newest history messages that fit the token budget of the call type
+
+    User messages are kept verbatim. Assistant replies are summarized, except
+    the latest one for plan calls when it fits, so follow-ups such as
+    "make it cheaper" still see the plan they refer to.
+    """
+    if not history:
+        return []
+    if budget is None:
+        budget = CONTEXT_BUDGETS.get(call_type, CONTEXT_TOKENS_PLAN)
+
+    fitted: List[Dict] = []
+    used = 0
+    keep_latest_plan = call_type == "plan"
+    for message in reversed(history):
+        content = message.get("content") or ""
+        if message.get("role") == "assistant":
+            verbatim = {"role": "assistant", "content": content}
+            if keep_latest_plan and used + message_tokens(verbatim) <= budget // 2:
+                candidate = verbatim
+            else:
+                candidate = {"role": "assistant", "content": summarize_plan(content)}
+            keep_latest_plan = False
+        else:
+            candidate = {"role": message.get("role", "user"), "content": content}
+
+        cost = message_tokens(candidate)
+        if used + cost > budget:
+            remaining = budget - used - MESSAGE_OVERHEAD_TOKENS
+            # Tin nhắn người dùng dài vẫn giữ phần đầu nếu còn chỗ
+            if candidate["role"] == "user" and remaining > 20 and not fitted:
+                candidate = {**candidate, "content": _truncate(content, remaining)}
+                fitted.append(candidate)
+            break
+        fitted.append(candidate)
+        used += cost
+
+    fitted.reverse()
+    return fitted
+
+
+def history_tokens(messages: List[Dict]) -> int:
+    """Tokens the given messages add to a prompt"""
+    return sum(message_tokens(message) for message in messages)
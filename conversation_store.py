@@ -0,0 +1,126 @@
+"""Disk-backed conversation history with a bounded in-memory window
+
+Messages are appended to SQLite keyed by session, and long assistant
+replies are stored zlib-compressed. Memory only holds the most recent
+messages of the most recently active sessions (LRU across sessions), so
+the process size stays bounded however long or numerous the chats are.
+Older messages are read back from disk when more than the window is asked for.
+"""
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict, deque
+from functools import lru_cache
+from typing import Dict, List
+
+from config import CONVERSATION_DB_PATH, CONVERSATION_MAX_SESSIONS, CONVERSATION_WINDOW
+
+# Tin nhắn của trợ lý dài hơn ngưỡng này được nén khi lưu
+COMPRESS_MIN_BYTES = 512
+
+
+class _Session:
+    def __init__(self, window: int, count: int):
+        self.recent = deque(maxlen=window)
+        self.count = count
+
+
+class ConversationStore:
+    """Append-only message log per session with LRU-bounded memory"""
+
+    def __init__(self, db_path: str = ":memory:", window: int = 20, max_sessions: int = 200):
+        self.window = window
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, _Session]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path or ":memory:", check_same_thread=False, timeout=10)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS messages ("
+            "session_id TEXT NOT NULL, seq INTEGER NOT NULL, role TEXT NOT NULL, content BLOB NOT NULL, "
+            "compressed INTEGER NOT NULL, created_at REAL NOT NULL, PRIMARY KEY (session_id, seq))"
+        )
+        self._db.commit()
+
+    @staticmethod
+    def _encode(role: str, content: str) -> tuple:
+        data = content.encode("utf-8")
+        if role == "assistant" and len(data) >= COMPRESS_MIN_BYTES:
+            return zlib.compress(data), 1
+        return data, 0
+
+    @staticmethod
+    def _decode(row) -> Dict:
+        seq, role, content, compressed = row
+        data = zlib.decompress(content) if compressed else content
+        return {"role": role, "content": data.decode("utf-8"), "seq": seq}
+
+    def _session(self, session_id: str) -> _Session:
+        """In-memory window of a session, loaded from disk if it was evicted"""
+        session = self._sessions.get(session_id)
+        if session is None:
+            count = self._db.execute("SELECT COUNT(*) FROM messages WHERE session_id = ?",
+                                     (session_id,)).fetchone()[0]
+            session = _Session(self.window, count)
+            session.recent.extend(self._read(session_id, count, self.window))
+            self._sessions[session_id] = session
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        self._sessions.move_to_end(session_id)
+        return session
+
+    def _read(self, session_id: str, before: int, limit: int) -> List[Dict]:
+        rows = self._db.execute(
+            "SELECT seq, role, content, compressed FROM messages WHERE session_id = ? AND seq < ? "
+            "ORDER BY seq DESC LIMIT ?",
+            (session_id, before, limit)
+        ).fetchall()
+        return [self._decode(row) for row in reversed(rows)]
+
+    def append(self, session_id: str, messages: List[Dict]):
+        """Add messages to the end of a session's conversation"""
+        with self._lock:
+            session = self._session(session_id)
+            now = time.time()
+            for message in messages:
+                content, compressed = self._encode(message["role"], message["content"])
+                self._db.execute(
+                    "INSERT INTO messages (session_id, seq, role, content, compressed, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (session_id, session.count, message["role"], content, compressed, now)
+                )
+                session.recent.append({"role": message["role"], "content": message["content"],
+                                       "seq": session.count})
+                session.count += 1
+            self._db.commit()
+
+    def count(self, session_id: str) -> int:
+        with self._lock:
+            return self._session(session_id).count
+
+    def recent(self, session_id: str, limit: int) -> List[Dict]:
+        """The last limit messages of a session, oldest first"""
+        if limit <= 0:
+            return []
+        with self._lock:
+            session = self._session(session_id)
+            if limit <= len(session.recent) or len(session.recent) == session.count:
+                return list(session.recent)[-limit:]
+            return self._read(session_id, session.count, limit)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "sessions_in_memory": len(self._sessions),
+                "messages_in_memory": sum(len(s.recent) for s in self._sessions.values())
+            }
+
+
+@lru_cache(maxsize=None)
+def get_conversation_store() -> ConversationStore:
+    return ConversationStore(CONVERSATION_DB_PATH, CONVERSATION_WINDOW, CONVERSATION_MAX_SESSIONS)
+
+
+def strip_metadata(messages: List[Dict]) -> List[Dict]:
+    """Messages as plain {"role", "content"} dicts for prompts"""
+    return [{"role": m["role"], "content": m["content"]} for m in messages]
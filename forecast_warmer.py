@@ -0,0 +1,190 @@
+"""Background refresher that keeps forecasts warm for popular destinations
+
+Every catalog destination plus the most recently requested locations are
+re-fetched ahead of expiry on a daemon thread, with bounded concurrency and
+exponential backoff when OpenWeather rate limits us. Locations whose
+forecast cannot be fetched are retried after a growing delay instead of
+every cycle. Turns for those cities read the warm store and never wait on
+the network.
+"""
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+import requests
+
+from config import (
+    WEATHER_API_KEY,
+    WEATHER_WARM_CONCURRENCY,
+    WEATHER_WARM_MAX_AGE,
+    WEATHER_WARM_RECENT,
+    WEATHER_WARM_REFRESH,
+    WEATHER_WARMER_ENABLED,
+)
+from hotel_catalog import get_hotel_catalog
+from weather import fetch_forecast, geocode_location, normalize_location
+
+# Chu kỳ kiểm tra các địa điểm đến hạn làm mới (giây)
+CHECK_INTERVAL = 60
+# Backoff khi bị giới hạn tốc độ: bắt đầu 30 giây, tối đa 15 phút
+BACKOFF_INITIAL = 30
+BACKOFF_MAX = 15 * 60
+# Địa điểm không lấy được dự báo (ví dụ không geocode được): thử lại sau 1 giờ, tăng gấp đôi, tối đa 1 ngày
+FAILURE_RETRY_INITIAL = 60 * 60
+FAILURE_RETRY_MAX = 24 * 60 * 60
+
+
+class ForecastWarmer:
+    """Warm store of forecasts refreshed on a background thread"""
+
+    def __init__(self, refresh_after: float = WEATHER_WARM_REFRESH, max_age: float = WEATHER_WARM_MAX_AGE,
+                 recent_size: int = WEATHER_WARM_RECENT, concurrency: int = WEATHER_WARM_CONCURRENCY):
+        self.refresh_after = refresh_after
+        self.max_age = max_age
+        self.recent_size = recent_size
+        self.concurrency = concurrency
+        self.backoff = 0.0
+        self._recent: "OrderedDict[str, str]" = OrderedDict()
+        # normalized location -> (forecast payload, fetched_at)
+        self._store: Dict[str, tuple] = {}
+        # normalized location -> (consecutive failures, retry_at)
+        self._failures: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        """Whether the refresher thread was started (the warm store stays empty otherwise)"""
+        return self._thread is not None and not self._stop.is_set()
+
+    def note_location(self, location: str):
+        """Remember a requested location so it is kept warm from now on"""
+        key = normalize_location(location or "")
+        if not key:
+            return
+        with self._lock:
+            self._recent[key] = location
+            self._recent.move_to_end(key)
+            while len(self._recent) > self.recent_size:
+                self._recent.popitem(last=False)
+
+    def warm_forecast(self, location: str) -> Optional[Dict]:
+        """Forecast payload from the warm store, or None if the location is not warm"""
+        with self._lock:
+            entry = self._store.get(normalize_location(location or ""))
+        if entry is None or time.time() - entry[1] > self.max_age:
+            return None
+        return entry[0]
+
+    def tracked_locations(self) -> List[str]:
+        """Catalog destinations followed by recently requested locations"""
+        locations = {normalize_location(name): name for name in get_hotel_catalog().locations}
+        with self._lock:
+            for key, name in self._recent.items():
+                locations.setdefault(key, name)
+        return list(locations.values())
+
+    def due_locations(self) -> List[str]:
+        now = time.time()
+        with self._lock:
+            fetched = {key: fetched_at for key, (_, fetched_at) in self._store.items()}
+            retry_at = {key: at for key, (_, at) in self._failures.items()}
+        due = []
+        for name in self.tracked_locations():
+            key = normalize_location(name)
+            if now - fetched.get(key, 0) >= self.refresh_after and now >= retry_at.get(key, 0):
+                due.append(name)
+        return due
+
+    def record_failure(self, location: str):
+        """Back off a location whose forecast could not be fetched, so it is not retried every cycle"""
+        key = normalize_location(location)
+        with self._lock:
+            failures = self._failures.get(key, (0, 0))[0] + 1
+            delay = min(FAILURE_RETRY_INITIAL * 2 ** (failures - 1), FAILURE_RETRY_MAX)
+            self._failures[key] = (failures, time.time() + delay)
+
+    def refresh(self, location: str) -> bool:
+        """Re-fetch one location's forecast; raises HTTPError when rate limited"""
+        coords = geocode_location(location)
+        forecast_data = fetch_forecast(coords[0], coords[1], refresh=True) if coords else {}
+        if not forecast_data.get('list'):
+            self.record_failure(location)
+            return False
+        key = normalize_location(location)
+        with self._lock:
+            self._store[key] = (forecast_data, time.time())
+            self._failures.pop(key, None)
+        return True
+
+    def prune(self):
+        """Forget forecasts and failures of locations that are no longer tracked"""
+        tracked = {normalize_location(name) for name in self.tracked_locations()}
+        with self._lock:
+            for entries in (self._store, self._failures):
+                for key in [key for key in entries if key not in tracked]:
+                    del entries[key]
+
+    def refresh_due(self) -> int:
+        """Refresh every due location with bounded concurrency; returns how many succeeded"""
+        # Địa điểm đã rời khỏi danh sách gần đây không còn được giữ trong bộ nhớ
+        self.prune()
+        due = self.due_locations()
+        if not due:
+            return 0
+        refreshed = 0
+        rate_limited = False
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            futures = [executor.submit(self.refresh, location) for location in due]
+            for location, future in zip(due, futures):
+                try:
+                    refreshed += bool(future.result())
+                except requests.HTTPError as e:
+                    if e.response is not None and e.response.status_code == 429:
+                        rate_limited = True
+                    else:
+                        print(f"Error warming forecast for {location}: {e}")
+                        self.record_failure(location)
+                except Exception as e:
+                    print(f"Error warming forecast for {location}: {e}")
+                    self.record_failure(location)
+        if rate_limited:
+            self.backoff = min(max(self.backoff * 2, BACKOFF_INITIAL), BACKOFF_MAX)
+            print(f"Weather API rate limited; pausing forecast warming for {self.backoff:.0f}s")
+        else:
+            self.backoff = 0.0
+        return refreshed
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.refresh_due()
+            except Exception as e:
+                print(f"Error warming forecasts: {e}")
+            self._stop.wait(self.backoff or CHECK_INTERVAL)
+
+    def start(self) -> "ForecastWarmer":
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="forecast-warmer", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+
+@lru_cache(maxsize=None)
+def get_forecast_warmer() -> ForecastWarmer:
+    return ForecastWarmer()
+
+
+@lru_cache(maxsize=None)
+def start_forecast_warmer() -> Optional[ForecastWarmer]:
+    """Start the background refresher once per process (no-op when disabled)"""
+    if not (WEATHER_WARMER_ENABLED and WEATHER_API_KEY):
+        return None
+    return get_forecast_warmer().start()
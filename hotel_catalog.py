@@ -0,0 +1,231 @@
+"""Indexed hotel catalog loaded from a columnar JSON file or SQLite
+
+Columnar JSON layout (one list per field, all the same length):
+
+    {
+      "locations": {"Da Nang": ["Đà Nẵng", "danang"], ...},
+      "hotels": {
+        "name": [...], "location": [...], "stars": [...], "address": [...],
+        "price_min_VND": [...], "price_max_VND": [...],
+        "price_min_USD": [...], "price_max_USD": [...],
+        "amenities": [[...], ...], "booking_link": [...], "highlights": [[...], ...]
+      }
+    }
+
+A SQLite catalog has a `hotels` table with the same columns (amenities
+and highlights stored as JSON text) and an optional
+`location_aliases (location, alias)` table. A price may be null for a
+currency; it is then converted from another currency of the same hotel.
+"""
+import json
+import os
+import sqlite3
+from bisect import bisect_right
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from config import EXCHANGE_RATES, HOTEL_CATALOG_PATH
+from text_utils import normalize_text
+
+LIST_COLUMNS = ("amenities", "highlights")
+
+
+def convert_currency(amount: float, from_currency: str, to_currency: str) -> Optional[float]:
+    """Convert an amount between currencies, or None if a rate is unknown"""
+    from_rate = EXCHANGE_RATES.get(from_currency.upper())
+    to_rate = EXCHANGE_RATES.get(to_currency.upper())
+    if from_rate is None or to_rate is None:
+        return None
+    return amount / from_rate * to_rate
+
+
+class HotelCatalog:
+    """Hotels stored column-wise with location and price indexes
+
+    For every (location, currency) pair the hotel ids are kept sorted by
+    minimum nightly price, so a budget filter is a binary search.
+    """
+
+    def __init__(self, columns: Dict[str, List], location_aliases: Optional[Dict[str, List[str]]] = None):
+        self.columns = columns
+        self.alias_lists = location_aliases or {}
+        self.size = len(columns["name"])
+        self.native_currencies = sorted(
+            column[len("price_min_"):] for column in columns if column.startswith("price_min_")
+        )
+        self.currencies = sorted(set(self.native_currencies) | set(EXCHANGE_RATES))
+
+        # Chỉ mục địa điểm: tên đã chuẩn hóa / bí danh -> tên chuẩn
+        self.location_aliases: Dict[str, str] = {}
+        self._by_location: Dict[str, List[int]] = {}
+        for hotel_id, location in enumerate(columns["location"]):
+            self._by_location.setdefault(location, []).append(hotel_id)
+        for location, aliases in self.alias_lists.items():
+            self._by_location.setdefault(location, [])
+            for alias in aliases:
+                self.location_aliases[normalize_text(alias)] = location
+        for location in self._by_location:
+            key = normalize_text(location)
+            self.location_aliases[key] = location
+            self.location_aliases.setdefault(key.replace(" ", ""), location)
+
+        # Tiện nghi lặp lại rất nhiều, nên chỉ chuẩn hóa mỗi chuỗi một lần
+        normalize_amenity = lru_cache(maxsize=None)(normalize_text)
+        self._amenities = [
+            frozenset(normalize_amenity(a) for a in amenities or [])
+            for amenities in columns.get("amenities", [[]] * self.size)
+        ]
+        self._price_index: Dict[Tuple[str, str], Tuple[List[float], List[int]]] = {}
+        for currency in self.currencies:
+            min_prices = self._min_price_column(currency)
+            for location, hotel_ids in self._by_location.items():
+                priced = sorted(i for i in hotel_ids if min_prices[i] is not None)
+                priced.sort(key=min_prices.__getitem__)
+                self._price_index[(location, currency)] = ([min_prices[i] for i in priced], priced)
+
+    def _min_price_column(self, currency: str) -> List[Optional[float]]:
+        """Minimum nightly price of every hotel in one currency, converting where needed"""
+        if currency in self.native_currencies:
+            prices = list(self.columns[f"price_min_{currency}"])
+        else:
+            prices = [None] * self.size
+        for native in self.native_currencies:
+            if native == currency or convert_currency(1, native, currency) is None:
+                continue
+            rate = convert_currency(1, native, currency)
+            for i, low in enumerate(self.columns[f"price_min_{native}"]):
+                if prices[i] is None and low is not None:
+                    prices[i] = round(low * rate)
+        return prices
+
+    @property
+    def locations(self) -> List[str]:
+        """Canonical names of all destinations in the catalog"""
+        return sorted(self._by_location)
+
+    def resolve_location(self, location: str) -> Optional[str]:
+        """Map "Đà Nẵng", "danang" or "Da Nang" to the catalog's location name"""
+        key = normalize_text(location or "")
+        return self.location_aliases.get(key) or self.location_aliases.get(key.replace(" ", ""))
+
+    def price_range(self, hotel_id: int, currency: str) -> Optional[Tuple[float, float]]:
+        """Nightly price range in the given currency, converted when the hotel has no native price"""
+        currency = currency.upper()
+        if currency in self.native_currencies:
+            low = self.columns[f"price_min_{currency}"][hotel_id]
+            high = self.columns[f"price_max_{currency}"][hotel_id]
+            if low is not None:
+                return low, high if high is not None else low
+        for native in self.native_currencies:
+            low = self.columns[f"price_min_{native}"][hotel_id]
+            if low is None:
+                continue
+            high = self.columns[f"price_max_{native}"][hotel_id]
+            converted_low = convert_currency(low, native, currency)
+            if converted_low is None:
+                return None
+            converted_high = convert_currency(high if high is not None else low, native, currency)
+            return round(converted_low), round(converted_high)
+        return None
+
+    def is_native_price(self, hotel_id: int, currency: str) -> bool:
+        """Whether the hotel lists its own price in this currency"""
+        currency = currency.upper()
+        return (currency in self.native_currencies
+                and self.columns[f"price_min_{currency}"][hotel_id] is not None)
+
+    def hotel(self, hotel_id: int, currency: str = "USD") -> Dict:
+        """Materialize one hotel as a dict with its price range in the given currency"""
+        hotel = {
+            column: values[hotel_id] for column, values in self.columns.items()
+            if not column.startswith("price_")
+        }
+        hotel["price_range"] = self.price_range(hotel_id, currency)
+        hotel["currency"] = currency.upper()
+        hotel["converted_price"] = not self.is_native_price(hotel_id, currency)
+        return hotel
+
+    def search(self, location: str, max_price: Optional[float] = None, currency: str = "USD",
+               min_stars: int = 0, amenities: Optional[Iterable[str]] = None, limit: int = 5) -> List[Dict]:
+        """Find hotels whose minimum nightly price fits max_price
+
+        Results are ordered from the most expensive affordable hotel down,
+        i.e. the best match for the budget first. max_price=None disables
+        the budget filter.
+        """
+        location = self.resolve_location(location)
+        currency = currency.upper()
+        if location is None or currency not in self.currencies:
+            return []
+
+        min_prices, hotel_ids = self._price_index[(location, currency)]
+        end = len(min_prices) if max_price is None else bisect_right(min_prices, max_price)
+        required = frozenset(normalize_text(a) for a in amenities or [])
+        stars = self.columns["stars"]
+
+        results = []
+        for position in range(end - 1, -1, -1):
+            hotel_id = hotel_ids[position]
+            if (stars[hotel_id] or 0) < min_stars:
+                continue
+            if required and not required <= self._amenities[hotel_id]:
+                continue
+            results.append(self.hotel(hotel_id, currency))
+            if len(results) >= limit:
+                break
+        return results
+
+    def count(self, location: str) -> int:
+        """Number of hotels listed for a location"""
+        location = self.resolve_location(location)
+        return len(self._by_location.get(location, [])) if location else 0
+
+    def to_sqlite(self, path: str):
+        """Write the catalog to a SQLite file readable by load_catalog"""
+        columns = list(self.columns)
+        with sqlite3.connect(path) as db:
+            db.execute("DROP TABLE IF EXISTS hotels")
+            db.execute(f"CREATE TABLE hotels ({', '.join(columns)})")
+            rows = (
+                tuple(json.dumps(self.columns[c][i], ensure_ascii=False) if c in LIST_COLUMNS
+                      else self.columns[c][i] for c in columns)
+                for i in range(self.size)
+            )
+            db.executemany(f"INSERT INTO hotels VALUES ({', '.join('?' * len(columns))})", rows)
+            db.execute("CREATE TABLE IF NOT EXISTS location_aliases (location TEXT, alias TEXT)")
+            db.execute("DELETE FROM location_aliases")
+            db.executemany(
+                "INSERT INTO location_aliases VALUES (?, ?)",
+                [(location, alias) for location, aliases in self.alias_lists.items() for alias in aliases]
+            )
+
+
+def _load_sqlite(path: str) -> HotelCatalog:
+    with sqlite3.connect(path) as db:
+        cursor = db.execute("SELECT * FROM hotels")
+        names = [d[0] for d in cursor.description]
+        rows = cursor.fetchall()
+        aliases: Dict[str, List[str]] = {}
+        if db.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'location_aliases'").fetchone():
+            for location, alias in db.execute("SELECT location, alias FROM location_aliases"):
+                aliases.setdefault(location, []).append(alias)
+    columns = {name: [row[i] for row in rows] for i, name in enumerate(names)}
+    for column in LIST_COLUMNS:
+        if column in columns:
+            columns[column] = [json.loads(value) if value else [] for value in columns[column]]
+    return HotelCatalog(columns, aliases)
+
+
+def load_catalog(path: str) -> HotelCatalog:
+    """Load a hotel catalog from a columnar JSON file or a SQLite database"""
+    if os.path.splitext(path)[1].lower() in (".db", ".sqlite", ".sqlite3"):
+        return _load_sqlite(path)
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    return HotelCatalog(data["hotels"], data.get("locations", {}))
+
+
+@lru_cache(maxsize=None)
+def get_hotel_catalog() -> HotelCatalog:
+    """Process-wide hotel catalog loaded from HOTEL_CATALOG_PATH"""
+    return load_catalog(HOTEL_CATALOG_PATH)
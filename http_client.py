@@ -0,0 +1,104 @@
+"""Shared, pooled HTTP client for all outbound API calls"""
+import random
+from functools import lru_cache
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from config import (
+    API_BASE,
+    HTTP_BACKOFF_FACTOR,
+    HTTP_BACKOFF_MAX,
+    HTTP_CONNECT_TIMEOUT,
+    HTTP_MAX_RETRIES,
+    HTTP_POOL_SIZE,
+    HTTP_READ_TIMEOUT,
+)
+
+DEFAULT_TIMEOUT = (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+
+# Rate limits and transient server errors are retried
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# OpenAI 429s are left to the process-wide governor (rate_limiter.py), which
+# pauses every request instead of one connection sleeping on Retry-After
+OPENAI_RETRY_STATUSES = (500, 502, 503, 504)
+
+
+class JitteredRetry(Retry):
+    """Retry policy with full-jitter exponential backoff
+
+    A Retry-After header on 429/503 responses still takes precedence,
+    since urllib3 sleeps for that value instead of the backoff.
+    """
+
+    def get_backoff_time(self) -> float:
+        backoff = super().get_backoff_time()
+        if backoff <= 0:
+            return 0
+        return random.uniform(0, min(backoff, HTTP_BACKOFF_MAX))
+
+
+class OpenAIRetry(JitteredRetry):
+    """Retry policy for the OpenAI endpoint, which never retries 429 itself
+
+    urllib3 retries any 429 carrying Retry-After even when 429 is not in
+    the status list, so it is dropped from the Retry-After statuses too.
+    """
+
+    RETRY_AFTER_STATUS_CODES = frozenset([413, 503])
+
+
+class TimeoutHTTPAdapter(HTTPAdapter):
+    """HTTP adapter that applies a default timeout to every request"""
+
+    def __init__(self, *args, timeout=DEFAULT_TIMEOUT, **kwargs):
+        self.timeout = timeout
+        super().__init__(*args, **kwargs)
+
+    def send(self, request, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.timeout
+        return super().send(request, **kwargs)
+
+
+def _adapter(retry_class, retry_statuses) -> TimeoutHTTPAdapter:
+    retry = retry_class(
+        total=HTTP_MAX_RETRIES,
+        connect=HTTP_MAX_RETRIES,
+        # Không retry khi đã gửi request mà bị timeout lúc đọc: completion có thể vẫn đang chạy
+        read=0,
+        status=HTTP_MAX_RETRIES,
+        status_forcelist=retry_statuses,
+        allowed_methods=None,
+        backoff_factor=HTTP_BACKOFF_FACTOR,
+        respect_retry_after_header=True,
+        raise_on_status=False
+    )
+    return TimeoutHTTPAdapter(
+        pool_connections=HTTP_POOL_SIZE,
+        pool_maxsize=HTTP_POOL_SIZE,
+        max_retries=retry
+    )
+
+
+def create_session() -> requests.Session:
+    """Create a keep-alive session with timeouts and retry/backoff"""
+    adapter = _adapter(JitteredRetry, RETRY_STATUSES)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    if API_BASE:
+        # Tiền tố dài nhất được chọn: các yêu cầu OpenAI dùng adapter không retry 429
+        session.mount(API_BASE.rstrip("/") + "/", _adapter(OpenAIRetry, OPENAI_RETRY_STATUSES))
+    return session
+
+
+@lru_cache(maxsize=None)
+def get_session() -> requests.Session:
+    """Get the process-wide HTTP session
+
+    This module is imported once per process, so the session and its
+    connection pools are shared by every Streamlit rerun and session.
+    """
+    return create_session()
@@ -0,0 +1,387 @@
+"""Rule-based extraction of travel requirements without an LLM round trip
+
+Most messages state the dates, destination and budget plainly, e.g.
+"Da Nang 2025-07-01 to 2025-07-05, 10 triệu VND". These are parsed
+locally; anything missing or ambiguous is reported so the caller can
+fall back to the extract_travel_info function call.
+"""
+import re
+import threading
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from text_utils import normalize_text
+
+MONTHS = {
+    "january": 1, "jan": 1, "february": 2, "feb": 2, "march": 3, "mar": 3,
+    "april": 4, "apr": 4, "may": 5, "june": 6, "jun": 6, "july": 7, "jul": 7,
+    "august": 8, "aug": 8, "september": 9, "sep": 9, "sept": 9,
+    "october": 10, "oct": 10, "november": 11, "nov": 11, "december": 12, "dec": 12
+}
+MONTH_PATTERN = "|".join(sorted(MONTHS, key=len, reverse=True))
+
+# Từ khóa cho thấy người dùng có sở thích cần LLM trích xuất
+PREFERENCE_CUES = re.compile(
+    r"\b(?:prefer\w*|interested in|fan of|vegetarian|vegan|halal|allerg\w*|seafood|hiking|"
+    r"snorkel\w*|diving|nightlife|museums?|shopping|thich|an chay|hai san|leo nui|lan bien|"
+    r"mua sam|so thich)\b"
+)
+
+WEATHER_CUES = re.compile(r"\b(?:weather|forecast|rain\w*|thoi tiet|du bao)\b")
+
+BUDGET_CUES = ("budget", "ngan sach", "chi phi", "kinh phi", "tong", "khoang", "around", "about")
+
+MAX_TRIP_DAYS = 60
+
+NUMBER = r"\d+(?:[.,]\d+)*"
+
+
+def parse_number(text: str) -> float:
+    """Parse "5.000.000", "5,000,000", "10.5" or "10,5" into a number"""
+    if re.fullmatch(r"\d{1,3}(?:[.,]\d{3})+", text):
+        return float(re.sub(r"[.,]", "", text))
+    return float(text.replace(",", "."))
+
+
+def _resolve_year(day: int, month: int, year: Optional[int], today: date) -> Optional[date]:
+    """Build a date, assuming the next occurrence when the year is omitted"""
+    try:
+        if year is not None:
+            return date(year if year > 100 else 2000 + year, month, day)
+        candidate = date(today.year, month, day)
+        if candidate < today:
+            candidate = date(today.year + 1, month, day)
+        return candidate
+    except ValueError:
+        return None
+
+
+def _take(text: str, span: Tuple[int, int]) -> str:
+    """Blank out a matched span so later patterns do not match it again"""
+    return text[:span[0]] + " " * (span[1] - span[0]) + text[span[1]:]
+
+
+def _extract_amounts(text: str) -> Tuple[List[Tuple[int, float, str]], str]:
+    """Find currency amounts as (position, amount, currency)"""
+    patterns = [
+        (rf"\$\s*({NUMBER})\s*(k)?\b", "USD", None),
+        (rf"\b({NUMBER})\s*(k)?\s*(?:usd|us\$|dollars?|do la)", "USD", None),
+        (rf"\b({NUMBER})\s*(?:ty|ti)\b", "VND", 1_000_000_000),
+        (r"\b(\d+)\s*tr(\d{1,3})\b", "VND", "tr_decimal"),
+        (rf"\b({NUMBER})\s*(?:trieu|tr)\b", "VND", 1_000_000),
+        (rf"\b({NUMBER})\s*(?:k|nghin|ngan(?!\s*sach))\b", "VND", 1_000),
+        (rf"\b({NUMBER})\s*(?:vnd|dong)\b", "VND", 1),
+        (r"\b(\d{1,3}(?:[.,]\d{3})+)\s*d\b", "VND", 1)
+    ]
+    amounts = []
+    for pattern, currency, multiplier in patterns:
+        for match in re.finditer(pattern, text):
+            if multiplier == "tr_decimal":
+                # "10tr5" = 10,5 triệu
+                value = float(f"{match.group(1)}.{match.group(2)}") * 1_000_000
+            else:
+                value = parse_number(match.group(1))
+                if multiplier is None:
+                    value *= 1_000 if match.group(2) else 1
+                else:
+                    value *= multiplier
+            amounts.append((match.start(), value, currency))
+            text = _take(text, match.span())
+    return sorted(amounts), text
+
+
+def _extract_dates(text: str, today: date) -> Tuple[List[Tuple[int, date]], bool, str]:
+    """Find explicit dates as (position, date); the flag marks invalid dates"""
+    found = []
+    invalid = False
+
+    def add(position: int, value: Optional[date]):
+        nonlocal invalid
+        if value is None:
+            invalid = True
+        else:
+            found.append((position, value))
+
+    # Khoảng ngày: "1/7 - 5/7", "1-5/7", "ngày 1 đến 5 tháng 7", "July 1-5", "1-5 July"
+    for match in re.finditer(r"(?<!/)\b(\d{1,2})/(\d{1,2})(?:/(\d{2,4}))?\s*(?:-|den|toi|to)\s*"
+                             r"(\d{1,2})/(\d{1,2})(?:/(\d{2,4}))?\b", text):
+        start_year = int(match.group(3)) if match.group(3) else None
+        end_year = int(match.group(6)) if match.group(6) else None
+        start = _resolve_year(int(match.group(1)), int(match.group(2)), start_year, today)
+        add(match.start(), start)
+        # Không ghi năm: ngày kết thúc là lần gần nhất kể từ ngày bắt đầu ("28/12 - 2/1")
+        add(match.start() + 1, _resolve_year(int(match.group(4)), int(match.group(5)), end_year, start or today))
+        text = _take(text, match.span())
+    for match in re.finditer(r"(?<!/)\b(\d{1,2})\s*-\s*(\d{1,2})/(\d{1,2})(?:/(\d{2,4}))?\b", text):
+        year = int(match.group(4)) if match.group(4) else None
+        start = _resolve_year(int(match.group(1)), int(match.group(3)), year, today)
+        add(match.start(), start)
+        add(match.start() + 1, _resolve_year(int(match.group(2)), int(match.group(3)),
+                                             start.year if start else year, today))
+        text = _take(text, match.span())
+    for match in re.finditer(r"\b(?:ngay\s+)?(\d{1,2})\s*(?:-|den|toi)\s*(?:ngay\s+)?(\d{1,2})\s+thang\s+(\d{1,2})"
+                             r"(?:\s+nam\s+(\d{4}))?\b", text):
+        year = int(match.group(4)) if match.group(4) else None
+        start = _resolve_year(int(match.group(1)), int(match.group(3)), year, today)
+        add(match.start(), start)
+        add(match.start() + 1, _resolve_year(int(match.group(2)), int(match.group(3)),
+                                             start.year if start else year, today))
+        text = _take(text, match.span())
+    for match in re.finditer(rf"\b({MONTH_PATTERN})\.?\s+(\d{{1,2}})\s*-\s*(\d{{1,2}})(?:,?\s*(\d{{4}}))?\b", text):
+        month = MONTHS[match.group(1)]
+        year = int(match.group(4)) if match.group(4) else None
+        start = _resolve_year(int(match.group(2)), month, year, today)
+        add(match.start(), start)
+        add(match.start() + 1, _resolve_year(int(match.group(3)), month,
+                                             start.year if start else year, today))
+        text = _take(text, match.span())
+    for match in re.finditer(rf"\b(\d{{1,2}})\s*-\s*(\d{{1,2}})\s+({MONTH_PATTERN})\b(?:,?\s*(\d{{4}}))?", text):
+        month = MONTHS[match.group(3)]
+        year = int(match.group(4)) if match.group(4) else None
+        start = _resolve_year(int(match.group(1)), month, year, today)
+        add(match.start(), start)
+        add(match.start() + 1, _resolve_year(int(match.group(2)), month,
+                                             start.year if start else year, today))
+        text = _take(text, match.span())
+
+    # Ngày đơn lẻ
+    single_patterns = [
+        # ISO: 2025-07-01
+        (r"\b(\d{4})-(\d{1,2})-(\d{1,2})\b", lambda m: (int(m.group(3)), int(m.group(2)), int(m.group(1)))),
+        # Tiếng Việt: ngày 1 tháng 7 năm 2025
+        (r"\b(?:ngay\s+)?(\d{1,2})\s+thang\s+(\d{1,2})(?:\s+nam\s+(\d{4}))?\b",
+         lambda m: (int(m.group(1)), int(m.group(2)), int(m.group(3)) if m.group(3) else None)),
+        # Ngày/tháng/năm: 01/07/2025, 1/7
+        (r"\b(\d{1,2})/(\d{1,2})(?:/(\d{2,4}))?\b",
+         lambda m: (int(m.group(1)), int(m.group(2)), int(m.group(3)) if m.group(3) else None)),
+        # English: July 1, 2025 / Jul 1st
+        (rf"\b({MONTH_PATTERN})\.?\s+(\d{{1,2}})(?:st|nd|rd|th)?\b(?:,?\s*(\d{{4}}))?",
+         lambda m: (int(m.group(2)), MONTHS[m.group(1)], int(m.group(3)) if m.group(3) else None)),
+        # English: 1 July 2025 / 1st of July
+        (rf"\b(\d{{1,2}})(?:st|nd|rd|th)?\s+(?:of\s+)?({MONTH_PATTERN})\b(?:,?\s*(\d{{4}}))?",
+         lambda m: (int(m.group(1)), MONTHS[m.group(2)], int(m.group(3)) if m.group(3) else None))
+    ]
+    for pattern, parts in single_patterns:
+        for match in re.finditer(pattern, text):
+            day, month, year = parts(match)
+            add(match.start(), _resolve_year(day, month, year, today))
+            text = _take(text, match.span())
+
+    return sorted(found), invalid, text
+
+
+def _ordered_dates(dates: List[Tuple[int, date]]) -> Optional[List[date]]:
+    """Distinct dates in the order they were written, or None when one comes before an earlier-written date"""
+    ordered = []
+    for _, value in dates:
+        if value not in ordered:
+            ordered.append(value)
+    return ordered if ordered == sorted(ordered) else None
+
+
+def _extract_relative_start(text: str, today: date) -> Tuple[Optional[date], str]:
+    """Find a relative start such as "tomorrow", "tuần sau" or "in 3 days\""""
+    patterns = [
+        # "tuần sau 5 ngày" là tuần sau, đi 5 ngày - không phải "sau 5 ngày"
+        (r"\b(?:in|(?<!tuan\s)(?<!thang\s)sau)\s+(\d+)\s+(?:days?|ngay)\b|\b(\d+)\s+ngay\s+nua\b",
+         lambda m: today + timedelta(days=int(m.group(1) or m.group(2)))),
+        (r"\b(?:day after tomorrow|ngay kia)\b", lambda m: today + timedelta(days=2)),
+        (r"\b(?:tomorrow|ngay mai)\b", lambda m: today + timedelta(days=1)),
+        (r"\b(?:today|hom nay)\b", lambda m: today),
+        (r"\b(?:next week|tuan sau|tuan toi)\b", lambda m: today + timedelta(days=7 - today.weekday())),
+        (r"\b(?:this weekend|next weekend|cuoi tuan nay|cuoi tuan sau|cuoi tuan)\b",
+         lambda m: today + timedelta(days=(5 - today.weekday()) % 7
+                                     + (7 if "next" in m.group(0) or "sau" in m.group(0) else 0))),
+        (r"\b(?:next month|thang sau|thang toi)\b",
+         lambda m: date(today.year + (today.month == 12), today.month % 12 + 1, 1))
+    ]
+    for pattern, resolve in patterns:
+        match = re.search(pattern, text)
+        if match:
+            return resolve(match), _take(text, match.span())
+    return None, text
+
+
+def _extract_duration(text: str) -> Optional[int]:
+    """Find a trip length in days, e.g. "3 days", "5 ngày 4 đêm", "3d2n", "a week\""""
+    match = re.search(r"\b(\d+)\s*d\s*(\d+)\s*n\b", text)
+    if match:
+        return int(match.group(1))
+    match = re.search(r"\b(\d+)\s*(?:days?|ngay)\b", text)
+    if match:
+        return int(match.group(1))
+    match = re.search(r"\b(\d+)\s*(?:nights?|dem)\b", text)
+    if match:
+        return int(match.group(1)) + 1
+    match = re.search(r"\b(\d+|a|one|mot)\s*(?:weeks?|tuan)\b", text)
+    if match:
+        count = match.group(1)
+        return 7 * (int(count) if count.isdigit() else 1)
+    return None
+
+
+def _match_locations(text: str, location_aliases: Dict[str, str]) -> List[str]:
+    """Find known destinations mentioned in the (normalized) text"""
+    found = []
+    # Ưu tiên tên dài hơn, ví dụ "vinh ha long" trước "ha long"
+    for alias in sorted(location_aliases, key=len, reverse=True):
+        match = re.search(rf"\b{re.escape(alias)}\b", text)
+        if match:
+            if location_aliases[alias] not in found:
+                found.append(location_aliases[alias])
+            text = _take(text, match.span())
+    return found
+
+
+def extract_requirements_locally(user_input: str, location_aliases: Dict[str, str],
+                                 today: Optional[date] = None) -> Tuple[Dict, List[str]]:
+    """Extract travel requirements with rules
+
+    Returns the extracted fields (same shape as extract_travel_info) and
+    the list of fields that are missing or ambiguous. An empty list means
+    the function-calling round trip can be skipped. location_aliases maps
+    normalized names and aliases of the known destinations to their
+    canonical name (see HotelCatalog.location_aliases).
+    """
+    today = today or date.today()
+    text = normalize_text(user_input)
+    result = {}
+    unresolved = []
+
+    if PREFERENCE_CUES.search(text):
+        unresolved.append("preferences")
+
+    # Ngân sách
+    amounts, text = _extract_amounts(text)
+    if len({(amount, currency) for _, amount, currency in amounts}) > 1:
+        # Nhiều số tiền: chỉ chọn số đứng sau từ khóa ngân sách
+        amounts = [a for a in amounts if any(cue in text[max(0, a[0] - 20):a[0]] for cue in BUDGET_CUES)]
+    if len({(amount, currency) for _, amount, currency in amounts}) == 1:
+        _, amount, currency = amounts[0]
+        result["budget_details"] = {"total": amount, "currency": currency}
+    else:
+        unresolved.append("budget_details")
+
+    # Thời gian
+    dates, invalid_date, text = _extract_dates(text, today)
+    relative_start, text = _extract_relative_start(text, today)
+    duration = _extract_duration(text)
+    distinct_dates = _ordered_dates(dates)
+    if invalid_date or distinct_dates is None or len(distinct_dates) > 2:
+        # Ngày kết thúc trước ngày bắt đầu cũng để mô hình xử lý
+        unresolved.append("start_date")
+    else:
+        start = distinct_dates[0] if distinct_dates else relative_start
+        end = distinct_dates[1] if len(distinct_dates) == 2 else None
+        if start is not None and end is None and duration:
+            end = start + timedelta(days=duration - 1)
+        if start is None:
+            unresolved.append("start_date")
+        elif end is None or not 0 <= (end - start).days < MAX_TRIP_DAYS:
+            # Cần ngày kết thúc để lên lịch trình theo ngày
+            unresolved.append("end_date")
+        else:
+            result["start_date"] = start.isoformat()
+            result["end_date"] = end.isoformat()
+
+    # Địa điểm
+    locations = _match_locations(text, location_aliases)
+    if len(locations) == 1:
+        result["location"] = locations[0]
+    else:
+        unresolved.append("location")
+
+    result["weather_check"] = bool(WEATHER_CUES.search(text))
+    return result, unresolved
+
+
+def extract_requirement_changes_locally(user_input: str, location_aliases: Dict[str, str], current: Dict,
+                                        today: Optional[date] = None) -> Tuple[Dict, bool]:
+    """Extract only the fields a follow-up message changes, e.g. "make it 5 days"
+
+    Returns the changed fields and whether the message needs the LLM: it
+    mentions preferences, something ambiguous, or nothing the rules
+    recognize (such as "make it cheaper").
+    """
+    today = today or date.today()
+    text = normalize_text(user_input)
+    delta = {}
+    if PREFERENCE_CUES.search(text):
+        return {}, True
+
+    amounts, text = _extract_amounts(text)
+    distinct_amounts = {(amount, currency) for _, amount, currency in amounts}
+    if len(distinct_amounts) > 1:
+        return {}, True
+    if distinct_amounts:
+        amount, currency = distinct_amounts.pop()
+        delta["budget_details"] = {"total": amount, "currency": currency}
+
+    dates, invalid_date, text = _extract_dates(text, today)
+    relative_start, text = _extract_relative_start(text, today)
+    duration = _extract_duration(text)
+    distinct_dates = _ordered_dates(dates)
+    if invalid_date or distinct_dates is None or len(distinct_dates) > 2:
+        return {}, True
+    start = distinct_dates[0] if distinct_dates else relative_start
+    end = distinct_dates[1] if len(distinct_dates) == 2 else None
+    if start is None and duration and current.get("start_date"):
+        # Chỉ đổi số ngày: giữ ngày bắt đầu hiện tại
+        try:
+            start = date.fromisoformat(current["start_date"])
+        except ValueError:
+            return {}, True
+    if start is not None:
+        if end is None and duration:
+            end = start + timedelta(days=duration - 1)
+        if end is not None and not 0 <= (end - start).days < MAX_TRIP_DAYS:
+            return {}, True
+        delta["start_date"] = start.isoformat()
+        if end is not None:
+            delta["end_date"] = end.isoformat()
+
+    locations = _match_locations(text, location_aliases)
+    if len(locations) > 1:
+        return {}, True
+    if locations:
+        delta["location"] = locations[0]
+
+    if current.get("legs") and {"start_date", "end_date", "location"} & set(delta):
+        # Chuyến đi nhiều chặng: để mô hình chia lại ngày và điểm đến cho từng chặng
+        return {}, True
+
+    if WEATHER_CUES.search(text):
+        delta["weather_check"] = True
+    return delta, not delta
+
+
+class ExtractionStats:
+    """Counts which extraction path was taken and how long it took"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {"local": 0, "llm": 0, "merged": 0, "delta-local": 0, "delta-llm": 0}
+        self._seconds = {path: 0.0 for path in self._counts}
+
+    def record(self, path: str, seconds: float):
+        with self._lock:
+            self._counts[path] += 1
+            self._seconds[path] += seconds
+
+    def snapshot(self) -> Dict:
+        """Hit rate of the local path and the estimated LLM latency it saved"""
+        with self._lock:
+            total = sum(self._counts.values())
+            avg = {path: (self._seconds[path] / self._counts[path] if self._counts[path] else 0.0)
+                   for path in self._counts}
+            return {
+                "local": self._counts["local"],
+                "llm": self._counts["llm"],
+                "local_hit_rate": round(self._counts["local"] / total, 3) if total else 0.0,
+                "avg_local_ms": round(avg["local"] * 1000, 2),
+                "avg_llm_ms": round(avg["llm"] * 1000, 2),
+                "estimated_saved_ms": round(max(avg["llm"] - avg["local"], 0) * self._counts["local"] * 1000, 1)
+            }
+
+
+extraction_stats = ExtractionStats()
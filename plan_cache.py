@@ -0,0 +1,87 @@
+"""Cache of generated travel plans keyed by normalized requirements"""
+import hashlib
+import json
+import math
+from functools import lru_cache
+from typing import Dict, Optional
+
+from cache import TTLCache
+from config import CACHE_DB_PATH, PLAN_CACHE_ENABLED, PLAN_CACHE_SIZE, PLAN_CACHE_TTL
+from text_utils import normalize_text
+
+# Fields that do not change the generated plan
+IGNORED_FIELDS = ("original_input", "extraction")
+
+
+def budget_bucket(amount) -> Optional[float]:
+    """Round a budget to two significant figures so near-identical budgets share a plan"""
+    try:
+        amount = float(amount)
+    except (TypeError, ValueError):
+        return None
+    if amount <= 0:
+        return 0.0
+    digits = int(math.floor(math.log10(amount))) - 1
+    return round(amount, -digits)
+
+
+def _normalize_value(value):
+    if isinstance(value, str):
+        return normalize_text(value)
+    if isinstance(value, list):
+        values = [_normalize_value(v) for v in value]
+        # Thứ tự các chặng của chuyến đi có ý nghĩa; chỉ sắp xếp danh sách giá trị đơn như sở thích
+        return values if any(isinstance(v, dict) for v in values) else sorted(values)
+    if isinstance(value, dict):
+        return {k: _normalize_value(v) for k, v in value.items() if v not in (None, "", [])}
+    return value
+
+
+def normalize_requirements(requirements: Dict, lang: str) -> Dict:
+    """Build the canonical form of the requirements that determines the plan"""
+    normalized = {
+        k: _normalize_value(v) for k, v in requirements.items()
+        if k not in IGNORED_FIELDS and k != "budget_details" and v not in (None, "", [], {})
+    }
+    budget = requirements.get("budget_details") or {}
+    normalized["budget_details"] = {
+        k: budget_bucket(v) if k != "currency" else str(v).upper()
+        for k, v in budget.items() if v not in (None, "")
+    }
+    normalized["weather_check"] = bool(requirements.get("weather_check"))
+    normalized["lang"] = lang
+    return normalized
+
+
+def plan_cache_key(requirements: Dict, lang: str) -> str:
+    """Canonical hash of the normalized requirements"""
+    canonical = json.dumps(normalize_requirements(requirements, lang), sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def is_cacheable(requirements: Dict) -> bool:
+    """Only plans for a known place and start date are shared
+
+    Vague messages ("hi", "what can you do?") all normalize to the same
+    near-empty key, and their replies depend on the session's history.
+    """
+    return bool((requirements.get("location") or requirements.get("legs")) and requirements.get("start_date"))
+
+
+@lru_cache(maxsize=None)
+def get_plan_cache() -> TTLCache:
+    """Process-wide plan cache, persisted to CACHE_DB_PATH when set"""
+    return TTLCache("plans", maxsize=PLAN_CACHE_SIZE, ttl=PLAN_CACHE_TTL, db_path=CACHE_DB_PATH)
+
+
+def get_cached_plan(requirements: Dict, lang: str) -> Optional[str]:
+    """Return a previously generated plan for these requirements, if any"""
+    if not PLAN_CACHE_ENABLED or not is_cacheable(requirements):
+        return None
+    return get_plan_cache().get(plan_cache_key(requirements, lang))
+
+
+def store_plan(requirements: Dict, lang: str, plan: str):
+    """Remember a generated plan for these requirements"""
+    if PLAN_CACHE_ENABLED and is_cacheable(requirements):
+        get_plan_cache().set(plan_cache_key(requirements, lang), plan)
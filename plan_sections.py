@@ -0,0 +1,106 @@
+"""Per-day sections of a generated plan and the edits a requirement change needs
+
+A plan is split on its day headings ("Day 3 (2025-07-03)", "### Ngày 3")
+so a follow-up that tweaks one detail can reuse unchanged days verbatim and
+ask the model only for the days that have to change.
+"""
+import re
+from typing import Dict, List, Optional, Tuple
+
+# Dòng tiêu đề ngày, có thể kèm định dạng markdown
+DAY_HEADING = re.compile(r"^[#*_>\t -]*(?:day|ngày)\s*(\d+)\b", re.IGNORECASE | re.MULTILINE)
+
+# Changes that alter the whole trip, so the plan is regenerated from scratch
+STRUCTURAL_FIELDS = ("location", "legs", "start_date", "budget_details.currency")
+
+# Largest relative budget change still handled by revising days
+MAX_BUDGET_CHANGE = 0.3
+
+
+def split_plan(text: str) -> Dict:
+    """Split a plan into the text before the first day and one section per day
+
+    Sections keep their exact text, so join_plan(split_plan(text)) == text.
+    """
+    matches = list(DAY_HEADING.finditer(text or ""))
+    if not matches:
+        return {"intro": text or "", "days": []}
+    days = []
+    for i, match in enumerate(matches):
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(text)
+        days.append({"day": int(match.group(1)), "text": text[match.start():end]})
+    return {"intro": text[:matches[0].start()], "days": days}
+
+
+def join_plan(sections: Dict) -> str:
+    return sections["intro"] + "".join(day["text"] for day in sections["days"])
+
+
+def _flatten(requirements: Dict) -> Dict:
+    flat = {}
+    for key, value in requirements.items():
+        if isinstance(value, dict):
+            for sub_key, sub_value in value.items():
+                flat[f"{key}.{sub_key}"] = sub_value
+        else:
+            flat[key] = value
+    return flat
+
+
+def diff_requirements(old: Dict, new: Dict) -> Dict[str, Tuple]:
+    """Changed fields as {"budget_details.total": (old, new), ...}"""
+    old_flat, new_flat = _flatten(old), _flatten(new)
+    return {key: (old_flat.get(key), new_flat.get(key))
+            for key in sorted(set(old_flat) | set(new_flat))
+            if old_flat.get(key) != new_flat.get(key)}
+
+
+def plan_edit(changes: Dict[str, Tuple], sections: Dict, new_days: int) -> Optional[Dict]:
+    """How to update a plan for the given changes, or None to regenerate it
+
+    Returns {"mode": "reuse"}, {"mode": "truncate", "days": n},
+    {"mode": "extend", "days": [n, ...]} or {"mode": "revise", "changes": ...}.
+    """
+    days = [day["day"] for day in sections["days"]]
+    # Chỉ sửa từng phần khi các ngày được đánh số liên tục từ 1
+    if not days or days != list(range(1, len(days) + 1)):
+        return None
+    if not changes:
+        return {"mode": "reuse"}
+    if any(field in changes for field in STRUCTURAL_FIELDS):
+        return None
+
+    if "end_date" in changes:
+        if set(changes) != {"end_date"} or not new_days:
+            return None
+        if new_days < len(days):
+            return {"mode": "truncate", "days": new_days}
+        if new_days > len(days):
+            return {"mode": "extend", "days": list(range(len(days) + 1, new_days + 1))}
+        return {"mode": "reuse"}
+
+    if "budget_details.total" in changes:
+        old_total, new_total = changes["budget_details.total"]
+        try:
+            if abs(float(new_total) - float(old_total)) > MAX_BUDGET_CHANGE * float(old_total):
+                return None
+        except (TypeError, ValueError, ZeroDivisionError):
+            return None
+    return {"mode": "revise", "changes": changes}
+
+
+def merge_revised_days(sections: Dict, revised_text: str) -> Tuple[Dict, List[int]]:
+    """Replace the days present in the model's answer; returns the new sections and the replaced days"""
+    revised = {day["day"]: day["text"] for day in split_plan(revised_text)["days"]}
+    replaced = []
+    days = []
+    for day in sections["days"]:
+        text = revised.get(day["day"])
+        if text is None:
+            days.append(day)
+            continue
+        # Giữ khoảng trắng phân cách giống bản cũ
+        trailing = day["text"][len(day["text"].rstrip()):] or "\n\n"
+        days.append({"day": day["day"], "text": text.rstrip() + trailing})
+        replaced.append(day["day"])
+    return {"intro": sections["intro"], "days": days}, replaced
@@ -0,0 +1,948 @@
+"""Travel planning pipeline, independent of the Streamlit UI
+
+get_travel_requirements -> get_weather_forecast -> get_hotel_recommendations
+-> generate_travel_plan. Conversation history is passed in explicitly, so
+the same functions serve the chat app and headless batch jobs.
+"""
+import json
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from config import (API_BASE, API_KEY, LOCAL_EXTRACTION, OPENAI_RATE_LIMIT_RETRIES, OPENAI_STREAM_USAGE,
+                    PARALLEL_PLAN_DAYS_PER_REQUEST,
+                    PARALLEL_PLAN_MIN_DAYS, PARALLEL_PLAN_WORKERS, PARTIAL_REVISION, SINGLE_ROUND_TRIP,
+                    WEATHER_CACHE_TTL)
+from context_window import fit_history, history_tokens
+from forecast_warmer import get_forecast_warmer
+from hotel_catalog import get_hotel_catalog
+from http_client import get_session
+from local_extractor import (NUMBER, extract_requirement_changes_locally, extract_requirements_locally,
+                             extraction_stats, parse_number)
+from plan_cache import get_cached_plan, store_plan
+from plan_sections import diff_requirements, join_plan, merge_revised_days, plan_edit, split_plan
+from prompts import (BUDGET_SUMMARY, DAY_FAILED, DAY_LABELS, DELTA_FUNCTION_CALL, DELTA_FUNCTIONS, DELTA_INSTRUCTIONS,
+                     EXTENSION_REQUEST, EXTRACTION_FUNCTION_CALL, EXTRACTION_FUNCTIONS, FOLLOW_UP_REQUEST, NO_CHANGES, OUTLINE_REQUEST,
+                     REQUIREMENTS_END, REQUIREMENTS_START, REVISION_REQUEST, day_chunk_request, delta_state_message,
+                     format_changes, merged_request_text, merged_system_message, parse_requirements_block,
+                     plan_request_text, plan_system_message, prompt_cache_stats)
+from rate_limiter import estimate_tokens, get_rate_limiter
+from single_flight import get_single_flight, payload_key
+from text_utils import detect_language
+from tracing import current_span, start_trace, traced
+from trip_state import TripState, trip_legs
+from weather import daily_forecasts, fetch_forecast, geocode_location, normalize_location
+
+PLAN_ERROR_MESSAGE = "Sorry, I couldn't generate a travel plan at this moment."
+
+# Longest leading text buffered while waiting for the requirements block to close
+MAX_REQUIREMENTS_BLOCK_CHARS = 4000
+
+# Chặng của chuyến đi nhiều điểm đến được tra cứu thời tiết cùng lúc
+MAX_LEG_WORKERS = 8
+
+# Completion limits for the outline and for each day of a parallel plan
+OUTLINE_MAX_TOKENS = 400
+DAY_MAX_TOKENS = 900
+
+# Dòng "Total: 1,200,000 VND" ở cuối mỗi ngày của lịch trình song song
+DAILY_TOTAL = re.compile(r"^[\s*_#>-]*(?:total|tổng)\s*[*_]*\s*:\s*[*_]*\s*~?\s*[$€]?\s*(" + NUMBER + ")",
+                         re.IGNORECASE | re.MULTILINE)
+
+@traced("weather")
+def get_weather_forecast(location: str, start_date: str, end_date: str) -> List[Dict]:
+    """Get weather forecast for the travel dates
+
+    Concurrent lookups for the same place and dates share one in-flight call.
+    """
+    key = f"{normalize_location(location or '')}|{start_date}|{end_date}"
+    forecasts, shared = get_single_flight("weather").do(key, _get_weather_forecast, location, start_date, end_date)
+    current_span().set(coalesced=shared)
+    return forecasts
+
+def _get_weather_forecast(location: str, start_date: str, end_date: str) -> List[Dict]:
+    try:
+        forecast_data = None
+        warmer = get_forecast_warmer()
+        if warmer.running:
+            warmer.note_location(location)
+            # Địa điểm được làm nóng sẵn: không chờ mạng
+            forecast_data = warmer.warm_forecast(location)
+            current_span().set(warm=forecast_data is not None)
+        
+        if forecast_data is None:
+            # Chuyển đổi địa điểm thành tọa độ (có cache)
+            coords = geocode_location(location)
+            
+            if not coords:
+                return []
+            
+            lat, lon = coords
+            
+            # Lấy dự báo thời tiết (có cache theo tọa độ)
+            forecast_data = fetch_forecast(lat, lon)
+        
+        return daily_forecasts(forecast_data, start_date, end_date)
+    except Exception as e:
+        print(f"Error getting weather forecast: {e}")
+        return []
+
+def _is_deterministic(payload: dict) -> bool:
+    """Payloads whose answer does not depend on sampling, so identical calls can share it"""
+    return payload.get("temperature") == 0 or "function_call" in payload or "seed" in payload
+
+@traced("openai.request")
+def make_openai_request(endpoint: str, payload: dict) -> dict:
+    """Make a request to the OpenAI API
+
+    Deterministic payloads (temperature 0, function calls or a fixed seed)
+    share one in-flight request with identical concurrent calls; sampled
+    completions are always requested separately.
+    """
+    if _is_deterministic(payload):
+        result, shared = get_single_flight("openai").do(payload_key(endpoint, payload), _post_openai_request,
+                                                        endpoint, payload)
+        current_span().set(coalesced=shared)
+        return result
+    return _post_openai_request(endpoint, payload)
+
+def _retry_after(response) -> Optional[float]:
+    try:
+        return float(response.headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+def _governed_post(endpoint: str, payload: dict, headers: dict, stream: bool = False):
+    """POST through the process-wide governor, queuing the request again while the API answers 429
+
+    Returns (response, estimated tokens). The caller releases the governor
+    slot once the response has been read.
+    """
+    limiter = get_rate_limiter()
+    estimated_tokens = estimate_tokens(payload)
+    for attempt in range(OPENAI_RATE_LIMIT_RETRIES + 1):
+        waited = limiter.acquire(estimated_tokens)
+        started = time.perf_counter()
+        try:
+            response = get_session().post(
+                f"{API_BASE}/{endpoint}",
+                headers=headers,
+                json=payload,
+                stream=stream
+            )
+        except BaseException:
+            limiter.release()
+            raise
+        latency = time.perf_counter() - started if stream else None
+        limiter.record_response(response.status_code, latency, _retry_after(response))
+        current_span().set(status=response.status_code, queue_ms=round(waited * 1000, 2), attempts=attempt + 1)
+        if response.status_code != 429 or attempt == OPENAI_RATE_LIMIT_RETRIES:
+            return response, estimated_tokens
+        # Bị giới hạn tốc độ: hoàn lại token ước tính rồi xếp hàng lại sau khoảng tạm dừng
+        response.close()
+        limiter.record_usage(estimated_tokens, 0)
+        limiter.release()
+
+def _post_openai_request(endpoint: str, payload: dict) -> dict:
+    headers = {
+        "Authorization": f"Bearer {API_KEY}",
+        "Content-Type": "application/json"
+    }
+    limiter = get_rate_limiter()
+    response, estimated_tokens = _governed_post(endpoint, payload, headers)
+    try:
+        result = response.json()
+    except ValueError:
+        result = {}
+    finally:
+        limiter.release()
+    usage = result.get("usage") or {}
+    if not response.ok:
+        # Lỗi không tốn token: hoàn lại phần đã ước tính; người gọi xử lý khi không có "choices"
+        print(f"OpenAI request failed with status {response.status_code}: {result.get('error') or response.reason}")
+        limiter.record_usage(estimated_tokens, usage.get("total_tokens", 0))
+        return result
+    current_span().record_usage(usage)
+    prompt_cache_stats.record(usage)
+    limiter.record_usage(estimated_tokens, usage.get("total_tokens"))
+    return result
+
+@traced("openai.stream")
+def make_openai_stream_request(endpoint: str, payload: dict) -> Iterator[str]:
+    """Make a streaming request to the OpenAI API and yield content deltas"""
+    headers = {
+        "Authorization": f"Bearer {API_KEY}",
+        "Content-Type": "application/json",
+        "Accept": "text/event-stream"
+    }
+    payload = {**payload, "stream": True}
+    if OPENAI_STREAM_USAGE:
+        # Usage block arrives in a final chunk with no choices
+        payload["stream_options"] = {"include_usage": True}
+    limiter = get_rate_limiter()
+    started = time.perf_counter()
+    first_token = True
+    response, estimated_tokens = _governed_post(endpoint, payload, headers, stream=True)
+    # Giữ slot của governor đến khi đọc xong stream (hoặc người đọc dừng sớm)
+    try:
+        with response:
+            if not response.ok:
+                limiter.record_usage(estimated_tokens, 0)
+            response.raise_for_status()
+            # SSE luôn là UTF-8; không có charset thì requests sẽ giải mã theo ISO-8859-1
+            response.encoding = "utf-8"
+            # Server-sent events: mỗi sự kiện là một dòng "data: {...}"
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                chunk = json.loads(data)
+                if chunk.get("usage"):
+                    current_span().record_usage(chunk["usage"])
+                    prompt_cache_stats.record(chunk["usage"])
+                    limiter.record_usage(estimated_tokens, chunk["usage"].get("total_tokens"))
+                if not chunk.get("choices"):
+                    continue
+                content = chunk["choices"][0].get("delta", {}).get("content")
+                if content:
+                    if first_token:
+                        current_span().set(ttft_ms=round((time.perf_counter() - started) * 1000, 2))
+                        first_token = False
+                    yield content
+    finally:
+        limiter.release()
+
+@traced("requirements.extract")
+def get_travel_requirements(user_input: str, history: Optional[List[Dict]] = None) -> Dict:
+    """Extract travel requirements, using function calling only when local rules are not enough"""
+    # Store original input for language detection
+    original_input = user_input
+    started = time.perf_counter()
+    
+    # Fast path: rule-based extraction skips the LLM round trip
+    if LOCAL_EXTRACTION:
+        result, unresolved = extract_requirements_locally(user_input, get_hotel_catalog().location_aliases)
+        if not unresolved:
+            elapsed = time.perf_counter() - started
+            extraction_stats.record("local", elapsed)
+            result['original_input'] = original_input
+            result['extraction'] = {"path": "local", "latency_ms": round(elapsed * 1000, 2)}
+            current_span().set(path="local")
+            return result
+    
+    # Add history that fits the extraction budget, with older plans summarized
+    messages = fit_history(history, "extraction")
+    current_span().set(history_tokens=history_tokens(messages))
+    # Add current user input
+    messages.append({"role": "user", "content": user_input})
+    
+    payload = {
+        "model": "GPT-4o-mini",
+        "messages": messages,
+        "functions": EXTRACTION_FUNCTIONS,
+        "function_call": EXTRACTION_FUNCTION_CALL,
+        "temperature": 0
+    }
+    
+    response = make_openai_request("chat/completions", payload)
+    elapsed = time.perf_counter() - started
+    extraction_stats.record("llm", elapsed)
+    extraction = {"path": "llm", "latency_ms": round(elapsed * 1000, 2)}
+    current_span().set(path="llm")
+    
+    # Extract the function call result
+    if response.get("choices") and response["choices"][0].get("message", {}).get("function_call"):
+        function_call = response["choices"][0]["message"]["function_call"]
+        result = json.loads(function_call["arguments"])
+        # Add original input for language detection
+        result['original_input'] = original_input
+        result['extraction'] = extraction
+        return result
+    return {'original_input': original_input, 'extraction': extraction}
+
+@traced("requirements.update")
+def update_trip_state(state: TripState, user_input: str, history: Optional[List[Dict]] = None) -> Dict:
+    """Merge the requirements of a new message into the session's trip state
+
+    The first message goes through full extraction. Follow-ups only extract
+    what changed: with rules when they can, otherwise with a function call
+    that sees the compact current state instead of the conversation.
+    """
+    if state.is_empty():
+        requirements = get_travel_requirements(user_input, history)
+        state.merge(requirements)
+        state.requirements['original_input'] = user_input
+        state.requirements['extraction'] = requirements.get('extraction')
+        return dict(state.requirements)
+
+    started = time.perf_counter()
+    delta, needs_llm = {}, True
+    if LOCAL_EXTRACTION:
+        delta, needs_llm = extract_requirement_changes_locally(user_input, get_hotel_catalog().location_aliases,
+                                                               state.trip_fields())
+    path = "delta-local"
+    if needs_llm:
+        path = "delta-llm"
+        delta = extract_requirement_changes(user_input, state.trip_fields())
+    elapsed = time.perf_counter() - started
+    extraction_stats.record(path, elapsed)
+    changed = state.merge(delta)
+    current_span().set(path=path, changed=sorted(changed))
+    state.requirements['original_input'] = user_input
+    state.requirements['extraction'] = {"path": path, "latency_ms": round(elapsed * 1000, 2),
+                                        "changed": sorted(changed)}
+    return dict(state.requirements)
+
+def extract_requirement_changes(user_input: str, current: Dict) -> Dict:
+    """Ask the model which trip fields a follow-up message adds or changes"""
+    payload = {
+        "model": "GPT-4o-mini",
+        "messages": [
+            DELTA_INSTRUCTIONS,
+            delta_state_message(current, datetime.now().strftime("%Y-%m-%d")),
+            {"role": "user", "content": user_input}
+        ],
+        "functions": DELTA_FUNCTIONS,
+        "function_call": DELTA_FUNCTION_CALL,
+        "temperature": 0
+    }
+    response = make_openai_request("chat/completions", payload)
+    if response.get("choices") and response["choices"][0].get("message", {}).get("function_call"):
+        try:
+            delta = json.loads(response["choices"][0]["message"]["function_call"]["arguments"])
+        except ValueError as e:
+            print(f"Error parsing requirement changes: {e}")
+            return {}
+        return delta if isinstance(delta, dict) else {}
+    return {}
+
+@traced("hotels.lookup")
+def get_hotel_recommendations(location: str, budget: Dict, lang: str = 'en', min_stars: int = 0,
+                              amenities: Optional[List[str]] = None, header: bool = True) -> str:
+    """Get hotel recommendations based on location and budget"""
+    catalog = get_hotel_catalog()
+    if not catalog.count(location):
+        return "No specific hotel recommendations available for this location." if lang == 'en' else "Không có đề xuất khách sạn cụ thể cho địa điểm này."
+    
+    currency = (budget.get('currency') or 'USD').upper()
+    total_budget = budget.get('total') or 0
+    accommodation_budget = budget.get('accommodation_budget') or total_budget * 0.4  # Assume 40% of total budget for accommodation
+    
+    if currency not in catalog.currencies:
+        # Không quy đổi được tiền tệ: bỏ lọc theo ngân sách và hiển thị giá USD
+        currency, accommodation_budget = 'USD', None
+    
+    suitable_hotels = catalog.search(location, accommodation_budget, currency,
+                                     min_stars=min_stars, amenities=amenities)
+    
+    if not suitable_hotels:
+        return "No hotels found within your budget." if lang == 'en' else "Không tìm thấy khách sạn phù hợp với ngân sách của bạn."
+    
+    if not header:
+        return format_hotels(suitable_hotels, currency, lang)
+    title = "🏨 Hotel Recommendations:\n\n" if lang == 'en' else "🏨 Đề xuất khách sạn:\n\n"
+    return title + format_hotels(suitable_hotels, currency, lang)
+
+def format_hotels(hotels: List[Dict], currency: str, lang: str = 'en') -> str:
+    """One bullet per hotel with its price range, amenities and booking link"""
+    if lang == 'en':
+        recommendations = ""
+        for hotel in hotels:
+            price_range = hotel['price_range']
+            approx = "~" if hotel['converted_price'] else ""
+            recommendations += f"""• {hotel['name']} ({hotel['stars']}⭐)
+- Address: {hotel['address']}
+- Price Range: {approx}{price_range[0]}-{price_range[1]} {currency}
+- Amenities: {', '.join(hotel['amenities'])}
+- Highlights: {', '.join(hotel['highlights'])}
+- Booking: {hotel['booking_link']}
+
+"""
+    else:
+        recommendations = ""
+        for hotel in hotels:
+            price_range = hotel['price_range']
+            approx = "~" if hotel['converted_price'] else ""
+            recommendations += f"""• {hotel['name']} ({hotel['stars']}⭐)
+- Địa chỉ: {hotel['address']}
+- Khoảng giá: {approx}{price_range[0]}-{price_range[1]} {currency}
+- Tiện nghi: {', '.join(hotel['amenities'])}
+- Điểm nổi bật: {', '.join(hotel['highlights'])}
+- Đặt phòng: {hotel['booking_link']}
+
+"""
+    
+    return recommendations
+
+@traced("hotels.trip")
+def get_trip_hotel_recommendations(requirements: Dict, lang: str = 'en') -> str:
+    """Hotel recommendations for every destination of the trip
+
+    Multi-city trips get one section per destination, each looked up once
+    with the share of the accommodation budget matching its days.
+    """
+    budget = requirements.get('budget_details') or {}
+    legs = trip_legs(requirements)
+    if len(legs) <= 1:
+        location = legs[0]['location'] if legs else requirements.get('location', '')
+        return get_hotel_recommendations(location, budget, lang)
+
+    # Gom các chặng cùng điểm đến (ví dụ quay lại Đà Nẵng cuối chuyến)
+    stays: Dict[str, List[Dict]] = {}
+    for leg in legs:
+        stays.setdefault(leg['location'], []).append(leg)
+    days = {location: sum(trip_days(leg) or 1 for leg in stay) for location, stay in stays.items()}
+    total_days = sum(days.values())
+    accommodation_budget = budget.get('accommodation_budget') or (budget.get('total') or 0) * 0.4
+
+    sections = ["🏨 Hotel Recommendations:" if lang == 'en' else "🏨 Đề xuất khách sạn:"]
+    for location, stay in stays.items():
+        leg_budget = dict(budget)
+        if accommodation_budget:
+            leg_budget['accommodation_budget'] = accommodation_budget * days[location] / total_days
+        dates = ", ".join(f"{leg['start_date']} → {leg['end_date']}" for leg in stay if leg['start_date'])
+        title = f"📍 {location} ({dates})" if dates else f"📍 {location}"
+        sections.append(f"{title}\n\n{get_hotel_recommendations(location, leg_budget, lang, header=False).strip()}")
+    return "\n\n".join(sections) + "\n"
+
+def get_plan_weather(requirements: Dict) -> List[Dict]:
+    """Get the weather forecast for the trip if the user asked for it
+
+    Multi-city trips fetch every leg concurrently, so they take about as
+    long as the slowest leg; each day then also names its destination.
+    """
+    if not (requirements.get('weather_check') and requirements.get('start_date')):
+        return []
+    legs = [leg for leg in trip_legs(requirements) if leg['start_date']]
+    if not legs:
+        return []
+    if len(legs) == 1:
+        return get_weather_forecast(legs[0]['location'], legs[0]['start_date'], legs[0]['end_date'])
+    with ThreadPoolExecutor(max_workers=min(len(legs), MAX_LEG_WORKERS)) as executor:
+        futures = [executor.submit(copy_context().run, get_weather_forecast, leg['location'], leg['start_date'],
+                                   leg['end_date'])
+                   for leg in legs]
+        return [{**day, 'location': leg['location']} for leg, future in zip(legs, futures) for day in future.result()]
+
+@traced("prompt.build")
+def build_travel_plan_messages(requirements: Dict, history: Optional[List[Dict]] = None,
+                               weather_info: Optional[List[Dict]] = None,
+                               hotel_recommendations: Optional[str] = None) -> List[Dict]:
+    """Build the chat messages used to generate a travel plan
+
+    Weather and hotel context are looked up unless they are passed in.
+    """
+    # Detect language from the original input
+    user_input = requirements.get('original_input', '')
+    lang = detect_language(user_input)
+    
+    # Get weather information if requested
+    if weather_info is None:
+        weather_info = get_plan_weather(requirements)
+    
+    # Get hotel recommendations (one section per destination of a multi-city trip)
+    if hotel_recommendations is None:
+        hotel_recommendations = get_trip_hotel_recommendations(requirements, lang)
+    
+    # Static instructions first so every request shares a cacheable prefix
+    messages = [plan_system_message(lang)]
+    # Add history that fits the plan budget, with older plans summarized
+    history_messages = fit_history(history, "plan")
+    current_span().set(history_tokens=history_tokens(history_messages))
+    messages.extend(history_messages)
+    # Variable requirement data goes last
+    messages.append({
+        "role": "user",
+        "content": plan_request_text(requirements, lang, weather_info, hotel_recommendations)
+    })
+    return messages
+
+def trip_plan_context(state: TripState, lang: str):
+    """Weather and hotel text for the session's trip, looked up again only when their inputs changed"""
+    requirements = state.requirements
+    weather_info = state.stage("weather", lambda: get_plan_weather(requirements), max_age=WEATHER_CACHE_TTL)
+    hotel_recommendations = state.stage(
+        "hotels",
+        lambda: get_trip_hotel_recommendations(requirements, lang),
+        lang
+    )
+    return weather_info, hotel_recommendations
+
+def build_trip_plan_messages(state: TripState, history: Optional[List[Dict]] = None) -> List[Dict]:
+    """Plan messages for the session's trip"""
+    lang = detect_language(state.requirements.get('original_input', ''))
+    weather_info, hotel_recommendations = trip_plan_context(state, lang)
+    return build_travel_plan_messages(state.requirements, history, weather_info, hotel_recommendations)
+
+@traced("plan.generate")
+def generate_travel_plan(requirements: Dict, history: Optional[List[Dict]] = None,
+                         use_cache: bool = True, messages: Optional[List[Dict]] = None) -> str:
+    """Generate a detailed travel plan based on requirements
+
+    messages may be passed when they were already built with build_travel_plan_messages.
+    """
+    lang = detect_language(requirements.get('original_input', ''))
+    if use_cache:
+        cached_plan = get_cached_plan(requirements, lang)
+        current_span().set(cache_hit=cached_plan is not None)
+        if cached_plan is not None:
+            return cached_plan
+    
+    if use_parallel_days(requirements):
+        chunks = []
+        try:
+            for chunk in stream_plan_by_day(requirements, history):
+                chunks.append(chunk)
+        except Exception as e:
+            print(f"Error generating travel plan: {e}")
+            return "".join(chunks) or PLAN_ERROR_MESSAGE
+        travel_plan = "".join(chunks)
+        store_plan(requirements, lang, travel_plan)
+        return travel_plan
+    
+    # Generate response with context
+    payload = {
+        "model": "GPT-4o-mini",
+        "messages": messages or build_travel_plan_messages(requirements, history)
+    }
+    
+    response = make_openai_request("chat/completions", payload)
+    
+    if response.get("choices"):
+        travel_plan = response["choices"][0]["message"]["content"]
+        store_plan(requirements, lang, travel_plan)
+        return travel_plan
+    return PLAN_ERROR_MESSAGE
+
+@traced("plan.generate")
+def stream_travel_plan(requirements: Dict, history: Optional[List[Dict]] = None,
+                       use_cache: bool = True, messages: Optional[List[Dict]] = None,
+                       context: Optional[Callable[[], Tuple[List[Dict], str]]] = None) -> Iterator[str]:
+    """Generate a travel plan and yield it chunk by chunk as it is produced
+
+    context, when given, returns the weather and hotel text for the plan
+    prompt; it is only called after a plan cache miss.
+    """
+    lang = detect_language(requirements.get('original_input', ''))
+    if use_cache:
+        cached_plan = get_cached_plan(requirements, lang)
+        current_span().set(cache_hit=cached_plan is not None)
+        if cached_plan is not None:
+            yield cached_plan
+            return
+    
+    if use_parallel_days(requirements):
+        # Chuyến đi dài: các nhóm ngày được sinh song song
+        source = stream_plan_by_day(requirements, history, context)
+    else:
+        if messages is None:
+            messages = build_travel_plan_messages(requirements, history, *(context() if context else ()))
+        payload = {
+            "model": "GPT-4o-mini",
+            "messages": messages
+        }
+        source = make_openai_stream_request("chat/completions", payload)
+    
+    chunks = []
+    completed = False
+    try:
+        for chunk in source:
+            chunks.append(chunk)
+            yield chunk
+        completed = True
+    except Exception as e:
+        print(f"Error streaming travel plan: {e}")
+    
+    if not chunks:
+        yield PLAN_ERROR_MESSAGE
+    elif completed:
+        # Chỉ lưu cache khi kế hoạch được tạo đầy đủ
+        store_plan(requirements, lang, "".join(chunks))
+
+@traced("plan.trip")
+def stream_trip_plan(state: TripState, history: Optional[List[Dict]] = None, use_cache: bool = True) -> Iterator[str]:
+    """Stream the plan for the session's trip
+
+    When the previous plan can be edited for the latest changes (see
+    plan_sections.plan_edit), unchanged days are reused verbatim and only the
+    affected days are requested; otherwise the whole plan is generated. A
+    message that changes no requirement (e.g. a question about the plan) is
+    answered from the history and the current plan instead.
+    """
+    requirements = state.requirements
+    lang = detect_language(requirements.get('original_input', ''))
+    changes = diff_requirements(state.plan["requirements"], state.trip_fields()) if state.plan else None
+    if changes == {}:
+        current_span().set(edit="follow_up")
+        yield from stream_follow_up(state, history, lang)
+        return
+
+    edit = None
+    if PARTIAL_REVISION and changes and state.plan["lang"] == lang:
+        edit = plan_edit(changes, state.plan["sections"], trip_days(requirements))
+
+    sections = None
+    if edit is not None:
+        try:
+            sections = revise_plan(state, edit, lang)
+        except Exception as e:
+            print(f"Error revising travel plan: {e}")
+    current_span().set(edit=edit["mode"] if sections is not None else "full")
+
+    if sections is not None:
+        travel_plan = join_plan(sections)
+        state.record_plan(travel_plan, lang)
+        store_plan(requirements, lang, travel_plan)
+        yield travel_plan
+        return
+
+    chunks = []
+    # Thời tiết và khách sạn chỉ được lấy khi không trúng cache kế hoạch
+    for chunk in stream_travel_plan(requirements, history, use_cache, context=lambda: trip_plan_context(state, lang)):
+        chunks.append(chunk)
+        yield chunk
+    travel_plan = "".join(chunks)
+    if travel_plan != PLAN_ERROR_MESSAGE:
+        state.record_plan(travel_plan, lang)
+
+def stream_follow_up(state: TripState, history: Optional[List[Dict]], lang: str) -> Iterator[str]:
+    """Answer a message that left the requirements unchanged, with the current plan in context
+
+    The plan cache is skipped: its key only covers the requirements, which
+    are the same as for the plan already shown.
+    """
+    messages = build_trip_plan_messages(state, history)
+    messages.append({
+        "role": "user",
+        "content": FOLLOW_UP_REQUEST.get(lang, FOLLOW_UP_REQUEST["en"]).format(
+            plan=join_plan(state.plan["sections"]), question=state.requirements.get('original_input', ''))
+    })
+    chunks = []
+    completed = False
+    try:
+        for chunk in make_openai_stream_request("chat/completions", {"model": "GPT-4o-mini", "messages": messages}):
+            chunks.append(chunk)
+            yield chunk
+        completed = True
+    except Exception as e:
+        print(f"Error answering follow-up message: {e}")
+    if not chunks:
+        yield PLAN_ERROR_MESSAGE
+    elif completed:
+        answer = "".join(chunks)
+        days = [day["day"] for day in split_plan(answer)["days"]]
+        # Chỉ coi là lịch trình mới khi câu trả lời có đủ các ngày 1..N (không phải câu hỏi đáp nhắc tới "Day 2")
+        if days and days == list(range(1, trip_days(state.requirements) + 1)):
+            state.record_plan(answer, lang)
+
+def revise_plan(state: TripState, edit: Dict, lang: str) -> Optional[Dict]:
+    """Apply a plan edit and return the new day sections, or None when a full plan is needed"""
+    sections = state.plan["sections"]
+    if edit["mode"] == "reuse":
+        return sections
+    if edit["mode"] == "truncate":
+        # Rút ngắn chuyến đi: bỏ các ngày cuối, không cần gọi mô hình
+        return {"intro": sections["intro"], "days": sections["days"][:edit["days"]]}
+
+    weather_info, hotel_recommendations = trip_plan_context(state, lang)
+    plan_text = join_plan(sections)
+    if edit["mode"] == "extend":
+        start = datetime.strptime(state.requirements['start_date'], "%Y-%m-%d")
+        dates = [(start + timedelta(days=day - 1)).strftime("%Y-%m-%d") for day in edit["days"]]
+        labels = DAY_LABELS.get(lang, DAY_LABELS["en"])
+        label = labels["one" if len(dates) == 1 else "range"].format(first=edit["days"][0], last=edit["days"][-1])
+        request = EXTENSION_REQUEST.get(lang, EXTENSION_REQUEST["en"]).format(plan=plan_text, label=label,
+                                                                              dates=", ".join(dates))
+    else:
+        request = REVISION_REQUEST.get(lang, REVISION_REQUEST["en"]).format(
+            changes=format_changes(edit["changes"]), plan=plan_text)
+
+    response = make_openai_request("chat/completions", {
+        "model": "GPT-4o-mini",
+        "messages": [
+            plan_system_message(lang),
+            {"role": "user", "content": plan_request_text(state.requirements, lang, weather_info,
+                                                          hotel_recommendations)},
+            {"role": "user", "content": request}
+        ]
+    })
+    if not response.get("choices"):
+        return None
+    answer = (response["choices"][0]["message"].get("content") or "").strip()
+
+    if edit["mode"] == "extend":
+        new_days = [day for day in split_plan(answer)["days"] if day["day"] in edit["days"]]
+        if [day["day"] for day in new_days] != edit["days"]:
+            return None
+        days = list(sections["days"])
+        days[-1] = {"day": days[-1]["day"], "text": days[-1]["text"].rstrip() + "\n\n"}
+        return {"intro": sections["intro"], "days": days + new_days}
+
+    if answer == NO_CHANGES:
+        return sections
+    revised, replaced = merge_revised_days(sections, answer)
+    current_span().set(revised_days=replaced)
+    return revised if replaced else None
+
+def trip_days(requirements: Dict) -> int:
+    """Number of days between start_date and end_date inclusive (0 if unknown)"""
+    try:
+        start = datetime.strptime(requirements['start_date'], "%Y-%m-%d")
+        end = datetime.strptime(requirements['end_date'], "%Y-%m-%d")
+    except (KeyError, TypeError, ValueError):
+        return 0
+    return max((end - start).days + 1, 0)
+
+def use_parallel_days(requirements: Dict) -> bool:
+    """Whether the trip is long enough to generate its days concurrently"""
+    return PARALLEL_PLAN_MIN_DAYS > 0 and trip_days(requirements) >= PARALLEL_PLAN_MIN_DAYS
+
+@traced("plan.outline")
+def generate_trip_outline(requirements: Dict, lang: str, hotel_recommendations: str,
+                          history: Optional[List[Dict]] = None) -> str:
+    """Short one-line-per-day outline shared by the per-day requests"""
+    messages = [plan_system_message(lang)]
+    messages.extend(fit_history(history, "plan"))
+    messages.append({
+        "role": "user",
+        "content": plan_request_text(requirements, lang, None, hotel_recommendations) + "\n\n"
+                   + OUTLINE_REQUEST.get(lang, OUTLINE_REQUEST["en"]).format(days=trip_days(requirements))
+    })
+    response = make_openai_request("chat/completions", {
+        "model": "GPT-4o-mini",
+        "messages": messages,
+        "max_tokens": OUTLINE_MAX_TOKENS
+    })
+    if response.get("choices"):
+        return (response["choices"][0]["message"].get("content") or "").strip()
+    return ""
+
+@traced("plan.day_chunk")
+def generate_day_chunk(shared_messages: List[Dict], request: str, days: int) -> str:
+    """Itinerary for a few consecutive days, written against the shared trip outline"""
+    response = make_openai_request("chat/completions", {
+        "model": "GPT-4o-mini",
+        "messages": shared_messages + [{"role": "user", "content": request}],
+        "max_tokens": DAY_MAX_TOKENS * days
+    })
+    if response.get("choices"):
+        return (response["choices"][0]["message"].get("content") or "").strip()
+    return ""
+
+def reconcile_budget(parts: List[str], budget: Dict, lang: str) -> str:
+    """Sum the daily totals of a parallel plan and compare them with the trip budget"""
+    total = 0.0
+    for match in DAILY_TOTAL.finditer("\n".join(parts)):
+        try:
+            total += parse_number(match.group(1))
+        except ValueError:
+            continue
+    if not total or not budget.get('total'):
+        return ""
+    currency = budget.get('currency', '')
+    labels = BUDGET_SUMMARY.get(lang, BUDGET_SUMMARY["en"])
+    summary = labels["total"].format(total=f"{round(total):,}", budget=f"{round(budget['total']):,}",
+                                     currency=currency)
+    if total > budget['total']:
+        summary += "\n" + labels["over"].format(over=f"{round(total - budget['total']):,}", currency=currency)
+    return summary
+
+@traced("plan.parallel")
+def stream_plan_by_day(requirements: Dict, history: Optional[List[Dict]] = None,
+                       context: Optional[Callable[[], Tuple[List[Dict], str]]] = None) -> Iterator[str]:
+    """Generate a long itinerary as concurrent requests of a few days each
+
+    Every request shares the trip requirements, hotel list and outline as a
+    common prefix and adds only its own days and their weather. Chunks are
+    yielded in order as soon as each one is ready, followed by the budget
+    check. Raises at the end if some days could not be generated, so the
+    incomplete plan is not cached. context, as in stream_travel_plan,
+    supplies the weather and hotel text instead of looking them up.
+    """
+    lang = detect_language(requirements.get('original_input', ''))
+    budget = requirements.get('budget_details') or {}
+    if context is not None:
+        weather_info, hotel_recommendations = context()
+    else:
+        weather_info = get_plan_weather(requirements)
+        hotel_recommendations = get_trip_hotel_recommendations(requirements, lang)
+    # Ngày chuyển chặng có thể có dự báo của cả hai điểm đến
+    weather_by_date: Dict[str, List[Dict]] = {}
+    for day in weather_info:
+        weather_by_date.setdefault(day['date'], []).append(day)
+    outline = generate_trip_outline(requirements, lang, hotel_recommendations, history)
+
+    start = datetime.strptime(requirements['start_date'], "%Y-%m-%d")
+    dates = [(start + timedelta(days=i)).strftime("%Y-%m-%d") for i in range(trip_days(requirements))]
+    size = max(PARALLEL_PLAN_DAYS_PER_REQUEST, 1)
+    groups = [dates[i:i + size] for i in range(0, len(dates), size)]
+
+    # Phần đầu chung cho mọi yêu cầu để tận dụng prompt cache
+    shared_messages = [
+        plan_system_message(lang),
+        {"role": "user", "content": plan_request_text(requirements, lang, None, hotel_recommendations)}
+    ]
+    if outline:
+        shared_messages.append({"role": "assistant", "content": outline})
+
+    executor = ThreadPoolExecutor(max_workers=min(PARALLEL_PLAN_WORKERS, len(groups)) or 1)
+    try:
+        futures = []
+        for index, group in enumerate(groups):
+            request = day_chunk_request(lang, index * size + 1, group, budget.get('currency', ''),
+                                        [w for d in group for w in weather_by_date.get(d, [])])
+            # Chạy trong bản sao context để span của từng yêu cầu nằm trong trace hiện tại
+            futures.append(executor.submit(copy_context().run, generate_day_chunk,
+                                           shared_messages, request, len(group)))
+
+        parts = []
+        failed = 0
+        for index, future in enumerate(futures):
+            try:
+                part = future.result()
+            except Exception as e:
+                print(f"Error generating days {groups[index][0]}..{groups[index][-1]}: {e}")
+                part = ""
+            if not part:
+                failed += 1
+                first = index * size + 1
+                labels = DAY_LABELS.get(lang, DAY_LABELS["en"])
+                label = labels["one" if len(groups[index]) == 1 else "range"].format(
+                    first=first, last=first + len(groups[index]) - 1)
+                part = DAY_FAILED.get(lang, DAY_FAILED["en"]).format(label=label)
+            parts.append(part)
+            yield ("\n\n" if index else "") + part
+    finally:
+        # Người dùng dừng sớm thì bỏ các yêu cầu chưa chạy
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    summary = reconcile_budget(parts, budget, lang)
+    if summary:
+        yield "\n\n" + summary
+    if failed:
+        raise RuntimeError(f"{failed} of {len(groups)} day groups could not be generated")
+
+class MergedPlanStream:
+    """Extract requirements and stream the plan from a single completion
+
+    Iterating yields the itinerary chunks; `requirements` is filled in from
+    the leading requirements block as soon as it has been parsed. When the
+    local rules already resolve everything, the plan is generated directly
+    (one round trip as well, and the plan cache still applies).
+    """
+
+    def __init__(self, user_input: str, history: Optional[List[Dict]] = None, use_cache: bool = True):
+        self.user_input = user_input
+        self.history = history
+        self.use_cache = use_cache
+        self.requirements: Optional[Dict] = None
+
+    def __iter__(self) -> Iterator[str]:
+        return self._generate()
+
+    @traced("plan.merged")
+    def _generate(self) -> Iterator[str]:
+        started = time.perf_counter()
+        partial, unresolved = extract_requirements_locally(self.user_input, get_hotel_catalog().location_aliases)
+        partial['original_input'] = self.user_input
+        if LOCAL_EXTRACTION and not unresolved:
+            elapsed = time.perf_counter() - started
+            extraction_stats.record("local", elapsed)
+            partial['extraction'] = {"path": "local", "latency_ms": round(elapsed * 1000, 2)}
+            current_span().set(path="local")
+            self.requirements = partial
+            yield from stream_travel_plan(partial, self.history, self.use_cache)
+            return
+
+        current_span().set(path="merged")
+        lang = detect_language(self.user_input)
+        # Khách sạn và thời tiết lấy theo điểm đến mà luật cục bộ đoán được
+        hotel_recommendations = None
+        if partial.get('location'):
+            hotel_recommendations = get_hotel_recommendations(partial['location'],
+                                                              partial.get('budget_details') or {}, lang)
+        messages = [merged_system_message(lang)]
+        messages.extend(fit_history(self.history, "plan"))
+        messages.append({"role": "user", "content": merged_request_text(
+            self.user_input, lang, datetime.now().strftime("%Y-%m-%d"),
+            get_plan_weather(partial), hotel_recommendations)})
+        payload = {"model": "GPT-4o-mini", "messages": messages}
+
+        buffer = ""
+        chunks = []
+        completed = False
+        try:
+            for chunk in make_openai_stream_request("chat/completions", payload):
+                if self.requirements is None:
+                    buffer += chunk
+                    # Chờ tới khi khối yêu cầu đóng lại rồi mới hiển thị lịch trình
+                    if REQUIREMENTS_END not in buffer and len(buffer) < MAX_REQUIREMENTS_BLOCK_CHARS:
+                        continue
+                    chunk = self._take_requirements(buffer, partial, started)
+                if not chunks:
+                    chunk = chunk.lstrip()
+                    if not chunk:
+                        continue
+                chunks.append(chunk)
+                yield chunk
+            completed = True
+        except Exception as e:
+            print(f"Error streaming travel plan: {e}")
+
+        if self.requirements is None:
+            chunk = self._take_requirements(buffer, partial, started)
+            if chunk:
+                chunks.append(chunk)
+                yield chunk
+        if not chunks:
+            yield PLAN_ERROR_MESSAGE
+        elif completed:
+            store_plan(self.requirements, lang, "".join(chunks))
+
+    def _take_requirements(self, buffer: str, partial: Dict, started: float) -> str:
+        """Set requirements from the buffered block and return the itinerary text after it"""
+        parsed = parse_requirements_block(buffer)
+        requirements = dict(partial)
+        if parsed is not None:
+            requirements.update({key: value for key, value in parsed.items() if value is not None})
+            buffer = buffer[buffer.index(REQUIREMENTS_END) + len(REQUIREMENTS_END):]
+        elif buffer.lstrip().startswith(REQUIREMENTS_START):
+            # Khối yêu cầu hỏng: bỏ phần đầu, giữ kết quả trích xuất cục bộ
+            buffer = buffer.split(REQUIREMENTS_END, 1)[-1] if REQUIREMENTS_END in buffer else ""
+        elapsed = time.perf_counter() - started
+        extraction_stats.record("merged", elapsed)
+        requirements['original_input'] = self.user_input
+        requirements['extraction'] = {"path": "merged", "latency_ms": round(elapsed * 1000, 2),
+                                      "parsed": parsed is not None}
+        self.requirements = requirements
+        return buffer.lstrip()
+
+def plan_trip(user_input: str, history: Optional[List[Dict]] = None, use_cache: bool = True) -> Dict:
+    """Run the whole pipeline for one user message without any UI
+
+    Returns the extracted requirements, the generated plan and the latency,
+    plus the per-stage trace when tracing is enabled.
+    """
+    started = time.perf_counter()
+    with start_trace("plan_trip") as trace:
+        if SINGLE_ROUND_TRIP:
+            stream = MergedPlanStream(user_input, history, use_cache)
+            travel_plan = "".join(stream)
+            requirements = stream.requirements or {'original_input': user_input}
+        else:
+            requirements = get_travel_requirements(user_input, history)
+            travel_plan = generate_travel_plan(requirements, history, use_cache)
+    result = {
+        "requirements": requirements,
+        "plan": travel_plan,
+        "ok": travel_plan != PLAN_ERROR_MESSAGE,
+        "latency_ms": round((time.perf_counter() - started) * 1000, 1)
+    }
+    if trace is not None:
+        result["trace"] = trace.to_dict()
+    return result
@@ -0,0 +1,471 @@
+"""Prompt assembly with a static, cache-friendly prefix
+
+Providers cache the longest prompt prefix they have seen recently, so the
+parts that never change (function schemas, system instructions) are built
+once per language and always sent first, byte for byte identical. The
+per-request data (dates, budget, hotels, weather) follows after them.
+"""
+import json
+import threading
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+from trip_state import trip_legs
+
+EXTRACTION_FUNCTIONS = [
+    {
+        "name": "extract_travel_info",
+        "description": "Extract detailed travel information from user input",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "start_date": {
+                    "type": "string",
+                    "description": "Start date of the trip (YYYY-MM-DD format)"
+                },
+                "end_date": {
+                    "type": "string",
+                    "description": "End date of the trip (YYYY-MM-DD format)"
+                },
+                "location": {
+                    "type": "string",
+                    "description": "Destination location; for a multi-city trip, the route such as \"Da Nang → Hoi An → Hue\""
+                },
+                "legs": {
+                    "type": "array",
+                    "description": "For a trip visiting several destinations, each destination in visiting order with its dates; omit for a single destination",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "location": {
+                                "type": "string",
+                                "description": "Destination of this leg"
+                            },
+                            "start_date": {
+                                "type": "string",
+                                "description": "First day at this destination (YYYY-MM-DD format)"
+                            },
+                            "end_date": {
+                                "type": "string",
+                                "description": "Last day at this destination (YYYY-MM-DD format)"
+                            }
+                        },
+                        "required": ["location"]
+                    }
+                },
+                "budget_details": {
+                    "type": "object",
+                    "properties": {
+                        "total": {
+                            "type": "number",
+                            "description": "Total budget for the trip"
+                        },
+                        "currency": {
+                            "type": "string",
+                            "description": "Currency of the budget (USD, VND, etc.)"
+                        },
+                        "accommodation_budget": {
+                            "type": "number",
+                            "description": "Budget allocated for accommodation"
+                        },
+                        "food_budget": {
+                            "type": "number",
+                            "description": "Budget allocated for food and dining"
+                        },
+                        "activities_budget": {
+                            "type": "number",
+                            "description": "Budget allocated for activities and attractions"
+                        },
+                        "transportation_budget": {
+                            "type": "number",
+                            "description": "Budget allocated for transportation"
+                        }
+                    },
+                    "required": ["total", "currency"]
+                },
+                "preferences": {
+                    "type": "object",
+                    "properties": {
+                        "accommodation_type": {
+                            "type": "string",
+                            "description": "Preferred type of accommodation (hotel, hostel, resort, etc.)"
+                        },
+                        "activities": {
+                            "type": "array",
+                            "items": {"type": "string"},
+                            "description": "List of preferred activities or interests"
+                        },
+                        "cuisine_preferences": {
+                            "type": "array",
+                            "items": {"type": "string"},
+                            "description": "Food preferences or dietary restrictions"
+                        },
+                        "transportation_mode": {
+                            "type": "string",
+                            "description": "Preferred mode of transportation"
+                        }
+                    }
+                },
+                "weather_check": {
+                    "type": "boolean",
+                    "description": "Whether to include weather information in the plan"
+                }
+            },
+            "required": ["start_date", "location", "budget_details"]
+        }
+    }
+]
+
+EXTRACTION_FUNCTION_CALL = {"name": "extract_travel_info"}
+
+PLAN_INSTRUCTIONS = {
+    "vi": """Là một trợ lý lập kế hoạch du lịch, hãy tạo một kế hoạch chi tiết dựa trên các yêu cầu của người dùng.
+
+Vui lòng cung cấp lịch trình chi tiết theo từng ngày bao gồm:
+
+Cho mỗi ngày:
+1. Thời gian biểu chi tiết (giờ cụ thể cho mỗi hoạt động)
+2. Chỗ ở đề xuất và giá cả
+3. Các hoạt động và địa điểm tham quan:
+   - Thời gian cho mỗi hoạt động
+   - Chi phí vào cửa/vé (nếu có)
+   - Thời gian di chuyển giữa các địa điểm
+4. Bữa ăn đề xuất:
+   - Nhà hàng hoặc địa điểm
+   - Món ăn đặc trưng
+   - Chi phí ước tính
+5. Phương tiện di chuyển:
+   - Loại phương tiện
+   - Chi phí
+   - Thời gian di chuyển
+6. Tổng chi phí trong ngày
+7. Mẹo và khuyến nghị địa phương
+
+Lưu ý:
+- Đảm bảo tổng chi phí nằm trong ngân sách
+- Cân nhắc thời tiết khi lên kế hoạch hoạt động
+- Có phương án dự phòng cho hoạt động ngoài trời
+- Trả lời bằng tiếng Việt""",
+    "en": """As a travel planning assistant, create a detailed plan based on the user's requirements.
+
+Please provide a detailed day-by-day itinerary including:
+
+For each day:
+1. Detailed timeline (specific hours for each activity)
+2. Accommodation recommendations and costs
+3. Activities and attractions:
+   - Duration for each activity
+   - Entrance/ticket costs (if any)
+   - Travel time between locations
+4. Meal recommendations:
+   - Restaurants or venues
+   - Signature dishes
+   - Estimated costs
+5. Transportation:
+   - Mode of transport
+   - Costs
+   - Travel duration
+6. Total daily expenses
+7. Local tips and recommendations
+
+Note:
+- Ensure total costs stay within budget
+- Consider weather conditions when planning activities
+- Include backup plans for outdoor activities
+- Answer in English"""
+}
+
+# Nhãn của phần dữ liệu thay đổi theo từng yêu cầu
+LABELS = {
+    "vi": {
+        "header": "Yêu cầu chuyến đi:",
+        "unknown": "Chưa xác định",
+        "start_date": "Ngày bắt đầu",
+        "end_date": "Ngày kết thúc",
+        "location": "Địa điểm",
+        "budget": "Ngân sách",
+        "total": "Tổng",
+        "accommodation_budget": "Chỗ ở",
+        "food_budget": "Ăn uống",
+        "activities_budget": "Hoạt động",
+        "transportation_budget": "Di chuyển",
+        "preferences": "Sở thích",
+        "accommodation_type": "Loại chỗ ở",
+        "activities": "Hoạt động yêu thích",
+        "cuisine_preferences": "Ẩm thực",
+        "transportation_mode": "Phương tiện di chuyển",
+        "route": "Lộ trình",
+        "leg_line": "- {location}: {start_date} → {end_date}",
+        "weather": "Thông tin thời tiết",
+        "weather_line": "- Ngày {date}: {temperature}°C, {description}, Thấp nhất: {min_temp}°C, Cao nhất: {max_temp}°C",
+        "weather_leg_line": "- {location}, ngày {date}: {temperature}°C, {description}, Thấp nhất: {min_temp}°C, Cao nhất: {max_temp}°C"
+    },
+    "en": {
+        "header": "Trip requirements:",
+        "unknown": "Not specified",
+        "start_date": "Start Date",
+        "end_date": "End Date",
+        "location": "Location",
+        "budget": "Budget",
+        "total": "Total",
+        "accommodation_budget": "Accommodation",
+        "food_budget": "Food",
+        "activities_budget": "Activities",
+        "transportation_budget": "Transportation",
+        "preferences": "Preferences",
+        "accommodation_type": "Accommodation Type",
+        "activities": "Preferred Activities",
+        "cuisine_preferences": "Cuisine Preferences",
+        "transportation_mode": "Transportation Mode",
+        "route": "Route",
+        "leg_line": "- {location}: {start_date} → {end_date}",
+        "weather": "Weather Information",
+        "weather_line": "- Date {date}: {temperature}°C, {description}, Low: {min_temp}°C, High: {max_temp}°C",
+        "weather_leg_line": "- {location}, {date}: {temperature}°C, {description}, Low: {min_temp}°C, High: {max_temp}°C"
+    }
+}
+
+BUDGET_FIELDS = ("total", "accommodation_budget", "food_budget", "activities_budget", "transportation_budget")
+
+
+def weather_lines(weather_info: List[Dict], lang: str) -> List[str]:
+    """One line per forecast day, naming the destination for multi-city trips"""
+    labels = LABELS.get(lang, LABELS["en"])
+    return [labels["weather_leg_line" if w.get("location") else "weather_line"].format(**w) for w in weather_info]
+
+
+@lru_cache(maxsize=None)
+def plan_system_message(lang: str) -> Dict:
+    """Static system message for plan generation, identical for every request in a language"""
+    return {"role": "system", "content": PLAN_INSTRUCTIONS.get(lang, PLAN_INSTRUCTIONS["en"])}
+
+
+def plan_request_text(requirements: Dict, lang: str, weather_info: Optional[List[Dict]] = None,
+                      hotel_recommendations: Optional[str] = None) -> str:
+    """Per-request part of the plan prompt: requirements, hotels and weather"""
+    labels = LABELS.get(lang, LABELS["en"])
+    unknown = labels["unknown"]
+    budget = requirements.get('budget_details') or {}
+    currency = budget.get('currency', '')
+    preferences = requirements.get('preferences') or {}
+
+    lines = [
+        labels["header"],
+        f"{labels['start_date']}: {requirements.get('start_date') or unknown}",
+        f"{labels['end_date']}: {requirements.get('end_date') or unknown}",
+        f"{labels['location']}: {requirements.get('location') or unknown}",
+    ]
+    legs = trip_legs(requirements)
+    if len(legs) > 1:
+        lines.append(f"{labels['route']}:")
+        lines += [labels["leg_line"].format(location=leg['location'], start_date=leg.get('start_date') or unknown,
+                                            end_date=leg.get('end_date') or unknown) for leg in legs]
+    lines += [
+        "",
+        f"{labels['budget']}:"
+    ]
+    for field in BUDGET_FIELDS:
+        value = budget.get(field)
+        lines.append(f"- {labels[field]}: {value} {currency}".rstrip() if value is not None else f"- {labels[field]}: {unknown}")
+    lines += [
+        "",
+        f"{labels['preferences']}:",
+        f"- {labels['accommodation_type']}: {preferences.get('accommodation_type') or unknown}",
+        f"- {labels['activities']}: {', '.join(preferences.get('activities') or [unknown])}",
+        f"- {labels['cuisine_preferences']}: {', '.join(preferences.get('cuisine_preferences') or [unknown])}",
+        f"- {labels['transportation_mode']}: {preferences.get('transportation_mode') or unknown}"
+    ]
+    if hotel_recommendations:
+        lines += ["", hotel_recommendations.strip()]
+    if weather_info:
+        lines += ["", f"{labels['weather']}:"]
+        lines += weather_lines(weather_info, lang)
+    return "\n".join(lines)
+
+
+class PromptCacheStats:
+    """Prompt tokens sent and how many of them the provider served from its cache"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._prompt_tokens = 0
+        self._cached_tokens = 0
+
+    def record(self, usage: Optional[Dict]):
+        if not usage or usage.get("prompt_tokens") is None:
+            return
+        cached = (usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0
+        with self._lock:
+            self._requests += 1
+            self._prompt_tokens += usage["prompt_tokens"]
+            self._cached_tokens += cached
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                "requests": self._requests,
+                "prompt_tokens": self._prompt_tokens,
+                "cached_tokens": self._cached_tokens,
+                "cached_ratio": round(self._cached_tokens / self._prompt_tokens, 3) if self._prompt_tokens else 0.0
+            }
+
+
+prompt_cache_stats = PromptCacheStats()
+
+
+REQUIREMENTS_START = "<requirements>"
+REQUIREMENTS_END = "</requirements>"
+
+# Định dạng trả lời cho chế độ một lượt gọi: khối yêu cầu JSON rồi tới lịch trình
+MERGED_FORMAT = {
+    "vi": """Đầu tiên, trích xuất yêu cầu chuyến đi từ tin nhắn mới nhất của người dùng (và cuộc trò chuyện trước đó nếu cần) thành một đối tượng JSON trên một dòng, đặt giữa {start} và {end}, theo JSON schema sau:
+{schema}
+Ngày tháng dùng định dạng YYYY-MM-DD. Sau đó, viết lịch trình theo hướng dẫn ở trên. Dữ liệu khách sạn và thời tiết đi kèm chỉ áp dụng cho điểm đến dự đoán; bỏ qua nếu điểm đến khác.""",
+    "en": """First, extract the trip requirements from the user's latest message (and the earlier conversation when needed) as one JSON object on a single line between {start} and {end}, following this JSON schema:
+{schema}
+Use YYYY-MM-DD dates. Then write the itinerary following the instructions above. The hotel and weather data provided apply to the likely destination only; ignore them if the destination differs."""
+}
+
+MERGED_LABELS = {
+    "vi": {"today": "Hôm nay", "message": "Tin nhắn của người dùng", "context": "Dữ liệu cho điểm đến dự đoán"},
+    "en": {"today": "Today", "message": "User message", "context": "Data for the likely destination"}
+}
+
+
+@lru_cache(maxsize=None)
+def merged_system_message(lang: str) -> Dict:
+    """Static system message asking for the requirements block followed by the itinerary"""
+    lang = lang if lang in PLAN_INSTRUCTIONS else "en"
+    schema = json.dumps(EXTRACTION_FUNCTIONS[0]["parameters"], ensure_ascii=False, separators=(",", ":"))
+    instructions = MERGED_FORMAT[lang].format(start=REQUIREMENTS_START, end=REQUIREMENTS_END, schema=schema)
+    return {"role": "system", "content": PLAN_INSTRUCTIONS[lang] + "\n\n" + instructions}
+
+
+def merged_request_text(user_input: str, lang: str, today: str, weather_info: Optional[List[Dict]] = None,
+                        hotel_recommendations: Optional[str] = None) -> str:
+    """Per-request part of the single round trip prompt"""
+    labels = MERGED_LABELS.get(lang, MERGED_LABELS["en"])
+    lines = [f"{labels['today']}: {today}", f"{labels['message']}: {user_input}"]
+    if hotel_recommendations or weather_info:
+        lines += ["", f"{labels['context']}:"]
+    if hotel_recommendations:
+        lines.append(hotel_recommendations.strip())
+    if weather_info:
+        lines += weather_lines(weather_info, lang)
+    return "\n".join(lines)
+
+
+def parse_requirements_block(text: str) -> Optional[Dict]:
+    """Requirements object from the leading block of a single round trip answer"""
+    start = text.find(REQUIREMENTS_START)
+    end = text.find(REQUIREMENTS_END, start + 1)
+    if start < 0 or end < 0:
+        return None
+    try:
+        requirements = json.loads(text[start + len(REQUIREMENTS_START):end].strip())
+    except ValueError:
+        return None
+    return requirements if isinstance(requirements, dict) else None
+
+
+# Sinh lịch trình song song theo từng nhóm ngày
+OUTLINE_REQUEST = {
+    "vi": "Viết dàn ý ngắn cho chuyến đi {days} ngày này: mỗi ngày một dòng dạng \"Ngày N (YYYY-MM-DD): khu vực hoặc chủ đề\". Không lặp lại điểm tham quan giữa các ngày. Không viết gì thêm.",
+    "en": "Write a short outline of this {days}-day trip: one line per day as \"Day N (YYYY-MM-DD): area or theme\". Do not repeat attractions across days. No other text."
+}
+
+DAY_CHUNK_REQUEST = {
+    "vi": "Chỉ viết lịch trình chi tiết cho {label} ({dates}), theo dàn ý trên và dùng khách sạn đã đề xuất. Mỗi ngày bắt đầu bằng \"Ngày N (YYYY-MM-DD)\" và kết thúc bằng một dòng \"Tổng: <số tiền> {currency}\".",
+    "en": "Write the detailed itinerary for {label} only ({dates}), following the outline above and using the recommended hotel. Start each day with \"Day N (YYYY-MM-DD)\" and end it with one line \"Total: <amount> {currency}\"."
+}
+
+DAY_LABELS = {
+    "vi": {"one": "ngày {first}", "range": "ngày {first}–{last}"},
+    "en": {"one": "day {first}", "range": "days {first}–{last}"}
+}
+
+DAY_FAILED = {
+    "vi": "_(Không tạo được lịch trình cho {label}.)_",
+    "en": "_(Could not generate the itinerary for {label}.)_"
+}
+
+BUDGET_SUMMARY = {
+    "vi": {"total": "Tổng chi phí ước tính: {total} {currency} (ngân sách: {budget} {currency})",
+           "over": "⚠️ Vượt ngân sách {over} {currency}; hãy cân nhắc lựa chọn rẻ hơn cho một số ngày."},
+    "en": {"total": "Estimated total: {total} {currency} (budget: {budget} {currency})",
+           "over": "⚠️ This is {over} {currency} over budget; consider cheaper options for some days."}
+}
+
+
+def day_chunk_request(lang: str, first_day: int, dates: List[str], currency: str,
+                      weather_info: Optional[List[Dict]] = None) -> str:
+    """Per-chunk part of a parallel plan request: which days to write and their weather"""
+    lang = lang if lang in DAY_LABELS else "en"
+    last_day = first_day + len(dates) - 1
+    label = DAY_LABELS[lang]["one" if len(dates) == 1 else "range"].format(first=first_day, last=last_day)
+    text = DAY_CHUNK_REQUEST[lang].format(label=label, dates=", ".join(dates), currency=currency)
+    if weather_info:
+        text += f"\n\n{LABELS[lang]['weather']}:\n" + "\n".join(weather_lines(weather_info, lang))
+    return text
+
+
+# Trích xuất phần thay đổi của tin nhắn tiếp theo so với trạng thái chuyến đi hiện tại
+DELTA_FUNCTIONS = [{
+    "name": "update_travel_info",
+    "description": "Fields of the trip that the user's latest message adds or changes",
+    "parameters": {key: value for key, value in EXTRACTION_FUNCTIONS[0]["parameters"].items() if key != "required"}
+}]
+
+DELTA_FUNCTION_CALL = {"name": "update_travel_info"}
+
+DELTA_INSTRUCTIONS = {
+    "role": "system",
+    "content": "You update a trip that is already being planned. Given the current trip requirements and the "
+               "user's latest message, return only the fields the message adds or changes, each with its "
+               "complete new value (for example the whole updated activities list). Leave out everything "
+               "that stays the same. Use YYYY-MM-DD dates; when only the length changes, keep the start date."
+}
+
+
+def delta_state_message(current: Dict, today: str) -> Dict:
+    """Compact current trip state sent instead of the raw conversation history"""
+    state = json.dumps(current, ensure_ascii=False, separators=(",", ":"), sort_keys=True)
+    return {"role": "system", "content": f"Today: {today}\nCurrent trip: {state}"}
+
+
+# Sửa một phần kế hoạch khi người dùng chỉ thay đổi vài chi tiết
+NO_CHANGES = "NO_CHANGES"
+
+REVISION_REQUEST = {
+    "vi": "Người dùng vừa thay đổi các yêu cầu sau:\n{changes}\n\nLịch trình hiện tại:\n{plan}\n\n"
+          "Chỉ sửa những ngày bị ảnh hưởng bởi các thay đổi này. Trả về mỗi ngày đã sửa thành một phần đầy đủ, "
+          "bắt đầu bằng đúng dòng tiêu đề cũ của ngày đó, theo thứ tự, và không viết gì khác. "
+          "Nếu không ngày nào cần sửa, chỉ trả về " + NO_CHANGES + ".",
+    "en": "The user just changed these requirements:\n{changes}\n\nCurrent itinerary:\n{plan}\n\n"
+          "Revise only the days affected by these changes. Return each revised day as a complete section that "
+          "starts with the day's original heading line, in order, and nothing else. "
+          "If no day needs to change, return only " + NO_CHANGES + "."
+}
+
+EXTENSION_REQUEST = {
+    "vi": "Lịch trình hiện tại:\n{plan}\n\nChuyến đi được kéo dài. Chỉ viết thêm {label} ({dates}) theo cùng định dạng, "
+          "không lặp lại các điểm tham quan đã có.",
+    "en": "Current itinerary:\n{plan}\n\nThe trip has been extended. Write only {label} ({dates}) in the same format, "
+          "without repeating attractions already planned."
+}
+
+
+# Câu hỏi tiếp theo khi yêu cầu chuyến đi không đổi
+FOLLOW_UP_REQUEST = {
+    "vi": "Lịch trình hiện tại:\n{plan}\n\nTin nhắn mới của người dùng:\n{question}\n\n"
+          "Trả lời tin nhắn này dựa trên lịch trình hiện tại. Chỉ viết lại lịch trình nếu người dùng yêu cầu.",
+    "en": "Current itinerary:\n{plan}\n\nThe user's new message:\n{question}\n\n"
+          "Answer this message based on the current itinerary. Rewrite the itinerary only if the user asks for it."
+}
+
+
+def format_changes(changes: Dict) -> str:
+    """One "- field: old → new" line per changed requirement"""
+    return "\n".join(f"- {field}: {json.dumps(old, ensure_ascii=False)} → {json.dumps(new, ensure_ascii=False)}"
+                     for field, (old, new) in changes.items())
@@ -0,0 +1,290 @@
+"""Process-wide governor for the OpenAI endpoint
+
+Every completion request waits here for a requests-per-minute and
+tokens-per-minute budget and for a concurrency slot. Waiting requests are
+served by priority, so interactive turns go ahead of batch jobs. The
+concurrency limit follows AIMD: it grows by about one slot per window of
+successful requests and is cut when the API answers 429 (which also pauses
+admissions for Retry-After) or when streamed responses start slower than
+the latency target. The HTTP client does not retry OpenAI 429s itself, so
+every rate limit answer reaches the governor.
+"""
+import heapq
+import itertools
+import json
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+from config import (
+    OPENAI_LATENCY_TARGET,
+    OPENAI_MAX_CONCURRENCY,
+    OPENAI_MIN_CONCURRENCY,
+    OPENAI_RPM,
+    OPENAI_TPM,
+)
+from tracing import metrics
+
+# Ước lượng thô: khoảng 4 ký tự cho mỗi token
+CHARS_PER_TOKEN = 4
+# Completion tokens reserved when the payload sets no max_tokens
+DEFAULT_COMPLETION_TOKENS = 1000
+
+# Mức ưu tiên: số nhỏ hơn được phục vụ trước
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 10
+PRIORITY_NAMES = {PRIORITY_INTERACTIVE: "interactive", PRIORITY_BATCH: "batch"}
+
+# Multiplicative decrease of the concurrency limit on a 429 and on a slow response
+RATE_LIMIT_DECREASE = 0.5
+LATENCY_DECREASE = 0.9
+# At most one decrease per interval, so a burst of 429s from one window counts once
+DECREASE_INTERVAL = 2.0
+# Admission pause after a 429 without Retry-After, doubled while 429s continue
+RATE_LIMIT_PAUSE = 1.0
+RATE_LIMIT_PAUSE_MAX = 30.0
+
+_priority: ContextVar[int] = ContextVar("request_priority", default=PRIORITY_INTERACTIVE)
+
+
+def estimate_tokens(payload: Dict) -> int:
+    """Estimate the total tokens a chat completion will use from the payload size"""
+    prompt_chars = len(json.dumps(payload.get("messages", []), ensure_ascii=False))
+    prompt_chars += len(json.dumps(payload.get("functions", []), ensure_ascii=False))
+    completion = payload.get("max_tokens") or DEFAULT_COMPLETION_TOKENS
+    return prompt_chars // CHARS_PER_TOKEN + completion
+
+
+@contextmanager
+def request_priority(priority: int):
+    """Queue the OpenAI requests made in this block (and in threads run with its context) at this priority"""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class TokenBucket:
+    """Token bucket refilled continuously up to a per-minute capacity"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until amount can be taken (0 if available now)"""
+        self._refill()
+        amount = min(amount, self.capacity)
+        return 0.0 if self.tokens >= amount else (amount - self.tokens) / self.rate
+
+    def take(self, amount: float):
+        self._refill()
+        self.tokens -= amount
+
+    def give_back(self, amount: float):
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class RateLimiter:
+    """Priority queue in front of the OpenAI endpoint with RPM/TPM budgets and an AIMD concurrency limit
+
+    Token cost is estimated before the call and corrected afterwards from
+    the usage block, so over-estimates are refunded and under-estimates
+    are charged. Callers pair acquire() with release() and report each
+    response with record_response().
+    """
+
+    def __init__(self, requests_per_minute: Optional[float] = None,
+                 tokens_per_minute: Optional[float] = None,
+                 max_concurrency: int = OPENAI_MAX_CONCURRENCY,
+                 min_concurrency: int = OPENAI_MIN_CONCURRENCY,
+                 latency_target: float = OPENAI_LATENCY_TARGET):
+        self._requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self._tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.max_concurrency = max(1, max_concurrency)
+        self.min_concurrency = max(1, min(min_concurrency, self.max_concurrency))
+        self.latency_target = latency_target
+        self.limit = float(self.max_concurrency)
+        self.in_flight = 0
+        self._waiting = []
+        self._sequence = itertools.count()
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+        self._consecutive_429 = 0
+        self._counters = {"admitted": 0, "throttled": 0, "slow": 0, "max_queued": 0, "wait_s": 0.0}
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+
+    def _admission_wait(self, tokens: int) -> Optional[float]:
+        """Seconds until the head of the queue can go, or None when it waits for a free slot"""
+        wait = self._paused_until - time.monotonic()
+        if self.in_flight >= int(self.limit):
+            return None
+        if self._requests:
+            wait = max(wait, self._requests.wait_time(1))
+        if self._tokens:
+            wait = max(wait, self._tokens.wait_time(tokens))
+        return max(wait, 0.0)
+
+    def acquire(self, tokens: int = 0, priority: Optional[int] = None) -> float:
+        """Wait for a slot and capacity for one request using about `tokens` tokens
+
+        priority defaults to the one set with request_priority. Returns the
+        seconds spent in the queue.
+        """
+        entry = (_priority.get() if priority is None else priority, next(self._sequence))
+        started = time.monotonic()
+        with self._changed:
+            heapq.heappush(self._waiting, entry)
+            self._counters["max_queued"] = max(self._counters["max_queued"], len(self._waiting))
+            try:
+                while True:
+                    wait = self._admission_wait(tokens) if self._waiting[0] == entry else None
+                    if wait == 0:
+                        break
+                    self._changed.wait(timeout=min(wait, 1.0) if wait is not None else 1.0)
+            except BaseException:
+                self._waiting.remove(entry)
+                heapq.heapify(self._waiting)
+                self._changed.notify_all()
+                raise
+            heapq.heappop(self._waiting)
+            if self._requests:
+                self._requests.take(1)
+            if self._tokens:
+                self._tokens.take(tokens)
+            self.in_flight += 1
+            waited = time.monotonic() - started
+            self._counters["admitted"] += 1
+            self._counters["wait_s"] += waited
+            # Yêu cầu kế tiếp trong hàng đợi trở thành đầu hàng
+            self._changed.notify_all()
+        return waited
+
+    def release(self):
+        """Free the slot taken by acquire once the response has been read"""
+        with self._changed:
+            self.in_flight = max(0, self.in_flight - 1)
+            self._changed.notify_all()
+
+    def _decrease(self, factor: float, now: float):
+        if now - self._last_decrease < DECREASE_INTERVAL:
+            return
+        self._last_decrease = now
+        self.limit = max(float(self.min_concurrency), self.limit * factor)
+
+    def record_response(self, status: int, latency: Optional[float] = None, retry_after: Optional[float] = None):
+        """Adjust the concurrency limit from one response
+
+        latency is the time to the first byte of a streamed response; it is
+        left out for non-streamed ones, whose headers only arrive with the
+        whole answer.
+        """
+        with self._changed:
+            now = time.monotonic()
+            if status == 429:
+                self._counters["throttled"] += 1
+                self._consecutive_429 += 1
+                if retry_after is None:
+                    retry_after = min(RATE_LIMIT_PAUSE * 2 ** (self._consecutive_429 - 1), RATE_LIMIT_PAUSE_MAX)
+                self._paused_until = max(self._paused_until, now + retry_after)
+                self._decrease(RATE_LIMIT_DECREASE, now)
+            elif status < 400:
+                self._consecutive_429 = 0
+                if self.latency_target and latency is not None and latency > self.latency_target:
+                    self._counters["slow"] += 1
+                    self._decrease(LATENCY_DECREASE, now)
+                else:
+                    # Tăng cộng: khoảng một slot sau mỗi `limit` lượt thành công
+                    self.limit = min(float(self.max_concurrency), self.limit + 1 / self.limit)
+            self._changed.notify_all()
+
+    def record_usage(self, estimated_tokens: int, actual_tokens: Optional[int]):
+        """Correct the token budget once the real usage is known"""
+        if not self._tokens or actual_tokens is None:
+            return
+        with self._lock:
+            difference = estimated_tokens - actual_tokens
+            if difference > 0:
+                self._tokens.give_back(difference)
+            else:
+                self._tokens.take(-difference)
+
+    def queue_depth(self) -> Dict[str, int]:
+        """Waiting requests per priority, e.g. {"interactive": 1, "batch": 12}"""
+        with self._lock:
+            depth = {name: 0 for name in PRIORITY_NAMES.values()}
+            for priority, _ in self._waiting:
+                name = PRIORITY_NAMES.get(priority, str(priority))
+                depth[name] = depth.get(name, 0) + 1
+            return depth
+
+    def stats(self) -> Dict:
+        queued = self.queue_depth()
+        with self._lock:
+            admitted = self._counters["admitted"]
+            return {
+                "concurrency_limit": round(self.limit, 2),
+                "in_flight": self.in_flight,
+                "queued": queued,
+                "max_queued": self._counters["max_queued"],
+                "admitted": admitted,
+                "throttled": self._counters["throttled"],
+                "slow": self._counters["slow"],
+                "avg_wait_ms": round(self._counters["wait_s"] / admitted * 1000, 2) if admitted else 0.0,
+                "paused_s": round(max(0.0, self._paused_until - time.monotonic()), 2)
+            }
+
+
+_limiter: Optional[RateLimiter] = None
+_limiter_lock = threading.Lock()
+
+
+def configure_rate_limits(requests_per_minute: Optional[float] = None,
+                          tokens_per_minute: Optional[float] = None):
+    """Replace the process-wide governor, e.g. with the RPM/TPM limits of a batch run
+
+    Limits left as None fall back to OPENAI_RPM/OPENAI_TPM.
+    """
+    global _limiter
+    with _limiter_lock:
+        _limiter = RateLimiter(requests_per_minute or OPENAI_RPM, tokens_per_minute or OPENAI_TPM)
+
+
+def get_rate_limiter() -> RateLimiter:
+    """The process-wide governor, created from the configuration on first use"""
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                _limiter = RateLimiter(OPENAI_RPM, OPENAI_TPM)
+    return _limiter
+
+
+def rate_limiter_stats() -> Dict:
+    return get_rate_limiter().stats()
+
+
+def _governor_gauges() -> Dict[str, Dict[str, float]]:
+    if _limiter is None:
+        return {}
+    stats = _limiter.stats()
+    return {
+        "openai_queue_depth": {f'priority="{name}"': count for name, count in stats["queued"].items()},
+        "openai_in_flight": {"": stats["in_flight"]},
+        "openai_concurrency_limit": {"": stats["concurrency_limit"]}
+    }
+
+
+metrics.register_gauges(_governor_gauges)
@@ -0,0 +1,78 @@
+"""Process-wide coalescing of identical in-flight upstream calls
+
+When several sessions ask for the same thing at the same time, only the
+first caller (the leader) runs the call; the others wait on its future and
+receive the same result, or the same exception. Nothing is kept after the
+call finishes, so this complements the caches rather than replacing them.
+Shared results must be treated as read-only.
+"""
+import hashlib
+import json
+import threading
+from concurrent.futures import Future
+from functools import lru_cache
+from typing import Any, Callable, Dict, Tuple
+
+
+class SingleFlight:
+    """Share one in-flight call among concurrent callers with the same key"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.executed = 0
+        self.coalesced = 0
+        self._calls: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: str, func: Callable, *args, **kwargs) -> Tuple[Any, bool]:
+        """Run func once per key at a time; returns (result, shared with another caller)"""
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._calls[key] = future
+                self.executed += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            return future.result(), True
+
+        try:
+            result = func(*args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            total = self.executed + self.coalesced
+            return {
+                "executed": self.executed,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._calls),
+                "coalesced_rate": round(self.coalesced / total, 3) if total else 0.0
+            }
+
+
+@lru_cache(maxsize=None)
+def get_single_flight(name: str) -> SingleFlight:
+    """Shared single-flight group for one kind of upstream call"""
+    return SingleFlight(name)
+
+
+def single_flight_stats() -> Dict[str, Dict]:
+    """Counters of every group used so far, e.g. {"openai": {"coalesced": 3, ...}}"""
+    return {name: get_single_flight(name).stats() for name in ("openai", "weather")}
+
+
+def payload_key(*parts) -> str:
+    """Stable key for a request from its JSON-serializable parts"""
+    data = json.dumps(parts, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
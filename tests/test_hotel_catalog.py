@@ -0,0 +1,48 @@
+import pytest
+
+from hotel_catalog import HotelCatalog, convert_currency
+
+COLUMNS = {
+    "name": ["Budget Inn", "Sea View", "Grand Resort", "Local Homestay", "Old Town Hotel"],
+    "location": ["Da Nang", "Da Nang", "Da Nang", "Da Nang", "Hoi An"],
+    "stars": [2, 4, 5, 3, 3],
+    "price_min_USD": [20, 60, 200, None, 40],
+    "price_max_USD": [30, 90, 400, None, 60],
+    "price_min_VND": [None, None, None, 1_000_000, None],
+    "price_max_VND": [None, None, None, 1_500_000, None],
+    "amenities": [["Wifi"], ["Wifi", "Pool"], ["Wifi", "Pool", "Spa"], ["Wifi"], ["Wifi"]],
+}
+ALIASES = {"Da Nang": ["Đà Nẵng", "danang"]}
+
+
+@pytest.fixture
+def catalog():
+    return HotelCatalog(COLUMNS, ALIASES)
+
+
+def test_convert_currency():
+    assert convert_currency(25_000, "VND", "USD") == pytest.approx(1.0)
+    assert convert_currency(1, "usd", "vnd") == pytest.approx(25_000)
+    assert convert_currency(1, "USD", "XYZ") is None
+
+
+def test_search_returns_best_match_for_budget_first(catalog):
+    names = [hotel["name"] for hotel in catalog.search("Da Nang", max_price=100, currency="USD")]
+    assert names == ["Sea View", "Local Homestay", "Budget Inn"]
+
+
+def test_search_converts_prices_of_hotels_without_native_price(catalog):
+    homestay = [hotel for hotel in catalog.search("Da Nang", currency="USD") if hotel["name"] == "Local Homestay"][0]
+    assert homestay["price_range"] == (40, 60)
+    assert homestay["converted_price"]
+
+
+def test_search_filters_stars_amenities_and_resolves_aliases(catalog):
+    assert [h["name"] for h in catalog.search("Đà Nẵng", min_stars=4)] == ["Grand Resort", "Sea View"]
+    assert [h["name"] for h in catalog.search("danang", amenities=["pool"], limit=1)] == ["Grand Resort"]
+    assert catalog.search("Nowhere") == []
+
+
+def test_search_in_vnd(catalog):
+    names = [hotel["name"] for hotel in catalog.search("Da Nang", max_price=1_200_000, currency="VND")]
+    assert names == ["Local Homestay", "Budget Inn"]
@@ -0,0 +1,63 @@
+from datetime import date
+
+from local_extractor import extract_requirement_changes_locally, extract_requirements_locally
+
+ALIASES = {"da nang": "Da Nang", "hoi an": "Hoi An"}
+TODAY = date(2025, 6, 1)
+
+
+def test_ngan_sach_is_not_a_thousands_unit():
+    requirements, missing = extract_requirements_locally("Đà Nẵng từ 1/7 đến 5/7 ngân sách 10 triệu", ALIASES,
+                                                         today=TODAY)
+    assert requirements["budget_details"] == {"total": 10_000_000, "currency": "VND"}
+    assert requirements["start_date"] == "2025-07-01"
+    assert requirements["end_date"] == "2025-07-05"
+    assert missing == []
+
+
+def test_date_change_with_unchanged_budget():
+    current = {"location": "Da Nang", "start_date": "2025-07-01", "end_date": "2025-07-05",
+               "budget_details": {"total": 10_000_000, "currency": "VND"}}
+    delta, needs_llm = extract_requirement_changes_locally("dời sang 10/7 ngân sách vẫn vậy", ALIASES, current,
+                                                           today=TODAY)
+    assert not needs_llm
+    assert delta == {"start_date": "2025-07-10"}
+
+
+def test_ngan_still_means_thousand():
+    requirements, _ = extract_requirements_locally("Đà Nẵng từ 1/7 đến 5/7, 500 ngàn", ALIASES, today=TODAY)
+    assert requirements["budget_details"] == {"total": 500_000, "currency": "VND"}
+
+
+def test_next_week_followed_by_duration():
+    requirements, _ = extract_requirements_locally("Đà Nẵng tuần sau 5 ngày", ALIASES, today=TODAY)
+    assert requirements["start_date"] == "2025-06-02"
+    assert requirements["end_date"] == "2025-06-06"
+
+
+def test_in_days_still_relative():
+    requirements, _ = extract_requirements_locally("Đà Nẵng sau 5 ngày, đi 3 ngày", ALIASES, today=TODAY)
+    assert requirements["start_date"] == "2025-06-06"
+
+
+def test_day_month_range_with_dash():
+    requirements, missing = extract_requirements_locally("Da Nang 1/7 - 5/7 10tr", ALIASES, today=TODAY)
+    assert requirements["start_date"] == "2025-07-01"
+    assert requirements["end_date"] == "2025-07-05"
+    assert requirements["budget_details"] == {"total": 10_000_000, "currency": "VND"}
+    assert missing == []
+
+
+def test_day_month_range_across_months():
+    requirements, _ = extract_requirements_locally("Da Nang 28/6 - 2/7", ALIASES, today=TODAY)
+    assert requirements["start_date"] == "2025-06-28"
+    assert requirements["end_date"] == "2025-07-02"
+
+
+def test_end_before_start_is_unresolved():
+    requirements, missing = extract_requirements_locally("Da Nang từ 5/7/2025 đến 1/7/2025", ALIASES, today=TODAY)
+    assert "start_date" not in requirements
+    assert "start_date" in missing
+    delta, needs_llm = extract_requirement_changes_locally("đổi thành 5/7/2025 - 1/7/2025", ALIASES,
+                                                           {"start_date": "2025-07-01"}, today=TODAY)
+    assert needs_llm
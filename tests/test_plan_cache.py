@@ -0,0 +1,40 @@
+from plan_cache import budget_bucket, is_cacheable, normalize_requirements, plan_cache_key
+
+TRIP = {"location": "Da Nang", "start_date": "2025-07-01", "end_date": "2025-07-05",
+        "budget_details": {"total": 10_000_000, "currency": "VND"}}
+
+
+def test_budget_bucket_keeps_two_significant_figures():
+    assert budget_bucket(12_345_678) == 12_000_000
+    assert budget_bucket(1_549) == 1_500
+    assert budget_bucket(0) == 0.0
+    assert budget_bucket("not a number") is None
+
+
+def test_normalize_requirements_ignores_spelling_and_metadata():
+    normalized = normalize_requirements({**TRIP, "location": "Đà Nẵng", "original_input": "Đà Nẵng 1-5/7",
+                                         "extraction": {"path": "local"},
+                                         "budget_details": {"total": 10_123_456, "currency": "vnd"}}, "vi")
+    assert normalized == {"location": "da nang", "start_date": "2025-07-01", "end_date": "2025-07-05",
+                          "budget_details": {"total": 10_000_000, "currency": "VND"},
+                          "weather_check": False, "lang": "vi"}
+
+
+def test_preferences_order_does_not_matter_but_leg_order_does():
+    first = {**TRIP, "preferences": {"activities": ["beach", "food"]}}
+    second = {**TRIP, "preferences": {"activities": ["food", "beach"]}}
+    assert plan_cache_key(first, "en") == plan_cache_key(second, "en")
+
+    legs = [{"location": "Da Nang"}, {"location": "Hoi An"}]
+    assert plan_cache_key({**TRIP, "legs": legs}, "en") != plan_cache_key({**TRIP, "legs": legs[::-1]}, "en")
+
+
+def test_key_depends_on_language():
+    assert plan_cache_key(TRIP, "en") != plan_cache_key(TRIP, "vi")
+
+
+def test_only_trips_with_place_and_start_are_cacheable():
+    assert is_cacheable(TRIP)
+    assert is_cacheable({"legs": [{"location": "Hoi An"}], "start_date": "2025-07-01"})
+    assert not is_cacheable({"original_input": "hi"})
+    assert not is_cacheable({"location": "Da Nang"})
@@ -0,0 +1,33 @@
+from plan_sections import join_plan, merge_revised_days, plan_edit, split_plan
+
+PLAN = "Your trip:\n\nDay 1: beach\n\nDay 2: market\n\nDay 3: islands\n"
+
+
+def test_split_and_join_round_trip():
+    sections = split_plan(PLAN)
+    assert [day["day"] for day in sections["days"]] == [1, 2, 3]
+    assert join_plan(sections) == PLAN
+
+
+def test_plan_edit_modes():
+    sections = split_plan(PLAN)
+    assert plan_edit({"end_date": ("2025-07-03", "2025-07-02")}, sections, 2) == {"mode": "truncate", "days": 2}
+    assert plan_edit({"end_date": ("2025-07-03", "2025-07-05")}, sections, 5) == {"mode": "extend", "days": [4, 5]}
+    assert plan_edit({"end_date": ("2025-07-03", "2025-07-03")}, sections, 3) == {"mode": "reuse"}
+    changes = {"budget_details.total": (10_000_000, 12_000_000)}
+    assert plan_edit(changes, sections, 3) == {"mode": "revise", "changes": changes}
+
+
+def test_plan_edit_regenerates_for_structural_or_large_changes():
+    sections = split_plan(PLAN)
+    assert plan_edit({"location": ("Da Nang", "Hoi An")}, sections, 3) is None
+    assert plan_edit({"budget_details.total": (10_000_000, 20_000_000)}, sections, 3) is None
+    assert plan_edit({"end_date": ("a", "b"), "budget_details.total": (1, 1.1)}, sections, 3) is None
+    # Ngày không được đánh số liên tục từ 1
+    assert plan_edit({"budget_details.total": (10, 11)}, split_plan("Day 2: x\n\nDay 5: y"), 2) is None
+
+
+def test_merge_revised_days_keeps_other_days_verbatim():
+    revised, replaced = merge_revised_days(split_plan(PLAN), "Day 2: night market\n")
+    assert replaced == [2]
+    assert join_plan(revised) == "Your trip:\n\nDay 1: beach\n\nDay 2: night market\n\nDay 3: islands\n"
@@ -0,0 +1,67 @@
+import threading
+import time
+
+import pytest
+
+from rate_limiter import PRIORITY_BATCH, PRIORITY_INTERACTIVE, RateLimiter
+
+
+def wait_until(condition, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not reached"
+        time.sleep(0.005)
+
+
+def test_interactive_requests_are_admitted_before_batch():
+    limiter = RateLimiter(max_concurrency=1, min_concurrency=1)
+    limiter.acquire()
+    admitted = []
+
+    def request(priority, name):
+        limiter.acquire(priority=priority)
+        admitted.append(name)
+        limiter.release()
+
+    threads = [threading.Thread(target=request, args=(PRIORITY_BATCH, "batch"))]
+    threads[0].start()
+    wait_until(lambda: limiter.queue_depth()["batch"] == 1)
+    threads.append(threading.Thread(target=request, args=(PRIORITY_INTERACTIVE, "interactive")))
+    threads[1].start()
+    wait_until(lambda: limiter.queue_depth()["interactive"] == 1)
+
+    limiter.release()
+    for thread in threads:
+        thread.join(5)
+    assert admitted == ["interactive", "batch"]
+
+
+def test_rate_limit_halves_the_limit_once_per_interval_and_pauses():
+    limiter = RateLimiter(max_concurrency=8, min_concurrency=2)
+    limiter.record_response(429, retry_after=30)
+    limiter.record_response(429, retry_after=30)
+    stats = limiter.stats()
+    assert stats["concurrency_limit"] == 4
+    assert stats["throttled"] == 2
+    assert stats["paused_s"] > 25
+
+
+def test_success_grows_the_limit_additively_up_to_the_maximum():
+    limiter = RateLimiter(max_concurrency=8, min_concurrency=2)
+    limiter.record_response(429, retry_after=0)
+    limiter.record_response(200)
+    assert limiter.limit == pytest.approx(4.25)
+    for _ in range(200):
+        limiter.record_response(200)
+    assert limiter.limit == 8
+
+
+def test_slow_responses_trim_the_limit_but_not_below_the_minimum():
+    limiter = RateLimiter(max_concurrency=8, min_concurrency=2, latency_target=1.0)
+    limiter.record_response(200, latency=5.0)
+    assert limiter.limit == pytest.approx(7.2)
+    assert limiter.stats()["slow"] == 1
+
+    limiter = RateLimiter(max_concurrency=2, min_concurrency=2)
+    limiter.record_response(429, retry_after=0)
+    assert limiter.limit == 2
@@ -0,0 +1,57 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from single_flight import SingleFlight
+
+
+def wait_until(condition, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not reached"
+        time.sleep(0.005)
+
+
+def test_concurrent_callers_share_one_call():
+    group = SingleFlight("test")
+    release = threading.Event()
+    calls = []
+
+    def slow(value):
+        calls.append(value)
+        release.wait(5)
+        return value * 2
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        leader = executor.submit(group.do, "key", slow, 21)
+        wait_until(lambda: calls)
+        follower = executor.submit(group.do, "key", slow, 21)
+        wait_until(lambda: group.coalesced == 1)
+        release.set()
+        assert leader.result() == (42, False)
+        assert follower.result() == (42, True)
+    assert calls == [21]
+    assert group.stats()["in_flight"] == 0
+
+
+def test_errors_reach_every_caller_and_are_not_kept():
+    group = SingleFlight("test")
+    release = threading.Event()
+
+    def failing():
+        release.wait(5)
+        raise ValueError("upstream down")
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        leader = executor.submit(group.do, "key", failing)
+        wait_until(lambda: group.stats()["in_flight"] == 1)
+        follower = executor.submit(group.do, "key", failing)
+        wait_until(lambda: group.coalesced == 1)
+        release.set()
+        with pytest.raises(ValueError):
+            leader.result()
+        with pytest.raises(ValueError):
+            follower.result()
+    assert group.do("key", lambda: "fresh") == ("fresh", False)
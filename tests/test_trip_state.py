@@ -0,0 +1,51 @@
+from trip_state import TripState, trip_legs
+
+
+def make_state(**requirements) -> TripState:
+    state = TripState()
+    state.merge(requirements)
+    return state
+
+
+def test_new_start_date_keeps_trip_length():
+    state = make_state(location="Da Nang", start_date="2025-07-01", end_date="2025-07-05")
+    changed = state.merge({"start_date": "2025-07-10"})
+    assert changed == {"start_date", "end_date"}
+    assert state.requirements["end_date"] == "2025-07-14"
+
+
+def test_budget_change_drops_old_allocation_and_merges_nested_fields():
+    state = make_state(budget_details={"total": 10_000_000, "currency": "VND", "food_budget": 2_000_000},
+                       preferences={"activities": ["beach"]})
+    state.merge({"budget_details": {"total": 12_000_000}, "preferences": {"food": ["seafood"]}})
+    assert state.requirements["budget_details"] == {"total": 12_000_000, "currency": "VND"}
+    assert state.requirements["preferences"] == {"activities": ["beach"], "food": ["seafood"]}
+
+
+def test_unchanged_and_meta_fields_are_not_reported():
+    state = make_state(location="Da Nang")
+    assert state.merge({"location": "Da Nang", "original_input": "again", "end_date": None}) == set()
+
+
+def test_legs_follow_date_shift_and_are_dropped_for_a_single_destination():
+    legs = [{"location": "Da Nang", "start_date": "2025-07-01", "end_date": "2025-07-02"},
+            {"location": "Hoi An", "start_date": "2025-07-03", "end_date": "2025-07-04"}]
+    state = make_state(location="Da Nang", start_date="2025-07-01", end_date="2025-07-04", legs=legs)
+    state.merge({"start_date": "2025-07-11"})
+    assert [leg["start_date"] for leg in state.requirements["legs"]] == ["2025-07-11", "2025-07-13"]
+
+    changed = state.merge({"location": "Nha Trang"})
+    assert "legs" in changed and "legs" not in state.requirements
+
+
+def test_trip_legs_single_destination():
+    assert trip_legs({"location": "Da Nang", "start_date": "2025-07-01", "end_date": "2025-07-03"}) == [
+        {"location": "Da Nang", "start_date": "2025-07-01", "end_date": "2025-07-03"}]
+    assert trip_legs({}) == []
+
+
+def test_trip_legs_split_undated_legs_evenly():
+    legs = trip_legs({"start_date": "2025-07-01", "end_date": "2025-07-05",
+                      "legs": [{"location": "Da Nang"}, {"location": "Hoi An"}]})
+    assert legs == [{"location": "Da Nang", "start_date": "2025-07-01", "end_date": "2025-07-03"},
+                    {"location": "Hoi An", "start_date": "2025-07-04", "end_date": "2025-07-05"}]
@@ -0,0 +1,27 @@
+from weather import daily_forecasts
+
+
+def entry(when: str, temp: float, description: str = "clear sky") -> dict:
+    return {"dt_txt": when, "main": {"temp": temp, "temp_min": temp - 1, "temp_max": temp + 1},
+            "weather": [{"description": description}]}
+
+
+FORECAST = {"list": [
+    entry("2025-06-30 21:00:00", 25),
+    entry("2025-07-01 00:00:00", 26, "light rain"),
+    entry("2025-07-01 12:00:00", 32),
+    entry("2025-07-02 12:00:00", 30),
+    entry("2025-07-04 12:00:00", 29)
+]}
+
+
+def test_daily_forecasts_aggregates_each_day_in_range():
+    assert daily_forecasts(FORECAST, "2025-07-01", "2025-07-03") == [
+        {"date": "2025-07-01", "temperature": 29.0, "description": "light rain", "min_temp": 25, "max_temp": 33},
+        {"date": "2025-07-02", "temperature": 30.0, "description": "clear sky", "min_temp": 29, "max_temp": 31}
+    ]
+
+
+def test_daily_forecasts_outside_the_window():
+    assert daily_forecasts(FORECAST, "2025-08-01", "2025-08-03") == []
+    assert daily_forecasts({}, "2025-07-01", "2025-07-01") == []
@@ -0,0 +1,22 @@
+"""Text normalization helpers shared by the lookup modules"""
+import re
+import unicodedata
+
+# Ký tự chỉ có trong tiếng Việt, dùng để nhận diện ngôn ngữ
+VIETNAMESE_CHARS = frozenset("àáảãạăắằẳẵặâấầẩẫậèéẻẽẹêếềểễệìíỉĩịòóỏõọôốồổỗộơớờởỡợùúủũụưứừửữựỳýỷỹỵđ")
+
+
+def strip_accents(text: str) -> str:
+    """Remove Vietnamese diacritics, e.g. "Đà Nẵng" -> "Da Nang\""""
+    text = unicodedata.normalize("NFD", text.replace("đ", "d").replace("Đ", "D"))
+    return "".join(c for c in text if not unicodedata.combining(c))
+
+
+def normalize_text(text: str) -> str:
+    """Lowercase, strip accents and collapse whitespace for accent-insensitive matching"""
+    return re.sub(r"\s+", " ", strip_accents(text)).strip().lower()
+
+
+def detect_language(text: str) -> str:
+    """Detect if the input is Vietnamese or English"""
+    return 'en' if VIETNAMESE_CHARS.isdisjoint(text.lower()) else 'vi'
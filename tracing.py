@@ -0,0 +1,323 @@
+"""Lightweight tracing of the request flow with per-stage latency and token usage
+
+Spans are opened with the `traced` decorator or the `span` context manager
+and grouped into a trace per chat turn. Every finished span also feeds
+process-wide metrics that can be exported in Prometheus text format, and
+each finished trace can be logged as one JSON line.
+
+When TRACING_ENABLED is false, `traced` returns the function unchanged and
+`span` returns a shared no-op object, so instrumentation costs nothing.
+"""
+import functools
+import inspect
+import json
+import sys
+import threading
+import time
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional
+
+from config import TRACE_LOG_JSON, TRACING_ENABLED
+
+# Giới hạn trên của các bucket histogram (giây)
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+TOKEN_KINDS = ("prompt_tokens", "completion_tokens", "total_tokens", "cached_tokens")
+
+
+class Span:
+    """A timed stage of the request flow"""
+
+    def __init__(self, name: str, parent: Optional["Span"], attributes: Dict):
+        self.name = name
+        self.parent = parent
+        self.depth = parent.depth + 1 if parent else 0
+        self.attributes = dict(attributes)
+        self.started = time.perf_counter()
+        self.duration: Optional[float] = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def record_usage(self, usage: Optional[Dict]):
+        """Attach the token counts of a completion's usage block"""
+        if not usage:
+            return
+        tokens = {kind: usage.get(kind) for kind in TOKEN_KINDS[:3] if usage.get(kind) is not None}
+        cached = (usage.get("prompt_tokens_details") or {}).get("cached_tokens")
+        if cached is not None:
+            tokens["cached_tokens"] = cached
+        self.attributes.update(tokens)
+        # Gắn số token theo thao tác cha, ví dụ requirements.extract hoặc plan.generate
+        metrics.add_tokens(self.parent.name if self.parent else self.name, tokens)
+
+
+class _NoopSpan:
+    """Stands in for a span when tracing is disabled"""
+
+    name = ""
+    attributes: Dict = {}
+
+    def set(self, **attributes):
+        pass
+
+    def record_usage(self, usage: Optional[Dict]):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Trace:
+    """All spans recorded while handling one chat turn or plan"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.started = time.perf_counter()
+        self.spans: List[Span] = []
+
+    def to_dict(self) -> Dict:
+        return {
+            "trace": self.name,
+            "duration_ms": round((time.perf_counter() - self.started) * 1000, 2),
+            "spans": [
+                {
+                    "name": s.name,
+                    "depth": s.depth,
+                    "offset_ms": round((s.started - self.started) * 1000, 2),
+                    "duration_ms": round(s.duration * 1000, 2) if s.duration is not None else None,
+                    **s.attributes
+                }
+                for s in self.spans
+            ]
+        }
+
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("current_trace", default=None)
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+class Metrics:
+    """Process-wide span duration histograms, token counters and gauges"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._durations: Dict[str, List] = {}
+        self._tokens: Dict[tuple, int] = {}
+        self._errors: Dict[str, int] = {}
+        self._gauges: List[Callable[[], Dict[str, Dict[str, float]]]] = []
+
+    def register_gauges(self, read: Callable[[], Dict[str, Dict[str, float]]]):
+        """Add gauges read at export time, as {"queue_depth": {'priority="batch"': 3}, ...}"""
+        with self._lock:
+            self._gauges.append(read)
+
+    def _read_gauges(self) -> Dict[str, Dict[str, float]]:
+        gauges = {}
+        for read in list(self._gauges):
+            gauges.update(read())
+        return gauges
+
+    def observe(self, name: str, seconds: float, error: bool = False):
+        with self._lock:
+            entry = self._durations.setdefault(name, [0, 0.0, [0] * len(DURATION_BUCKETS)])
+            entry[0] += 1
+            entry[1] += seconds
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if seconds <= bound:
+                    entry[2][i] += 1
+            if error:
+                self._errors[name] = self._errors.get(name, 0) + 1
+
+    def add_tokens(self, operation: str, tokens: Dict):
+        with self._lock:
+            for kind, count in tokens.items():
+                key = (operation, kind)
+                self._tokens[key] = self._tokens.get(key, 0) + int(count)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                "spans": {
+                    name: {"count": count, "total_s": round(total, 4),
+                           "avg_ms": round(total / count * 1000, 2) if count else 0.0,
+                           "errors": self._errors.get(name, 0)}
+                    for name, (count, total, _) in self._durations.items()
+                },
+                "tokens": {f"{operation}.{kind}": count for (operation, kind), count in self._tokens.items()},
+                "gauges": {f"{name}{{{labels}}}" if labels else name: value
+                           for name, series in self._read_gauges().items() for labels, value in series.items()}
+            }
+
+    def render_prometheus(self) -> str:
+        """Export the metrics in Prometheus text exposition format"""
+        lines = [
+            "# HELP travel_planner_span_duration_seconds Duration of each stage of the request flow",
+            "# TYPE travel_planner_span_duration_seconds histogram"
+        ]
+        with self._lock:
+            for name, (count, total, buckets) in sorted(self._durations.items()):
+                for bound, bucket_count in zip(DURATION_BUCKETS, buckets):
+                    lines.append(f'travel_planner_span_duration_seconds_bucket{{span="{name}",le="{bound}"}} {bucket_count}')
+                lines.append(f'travel_planner_span_duration_seconds_bucket{{span="{name}",le="+Inf"}} {count}')
+                lines.append(f'travel_planner_span_duration_seconds_sum{{span="{name}"}} {total:.6f}')
+                lines.append(f'travel_planner_span_duration_seconds_count{{span="{name}"}} {count}')
+            lines.append("# HELP travel_planner_span_errors_total Stages that raised an exception")
+            lines.append("# TYPE travel_planner_span_errors_total counter")
+            for name, count in sorted(self._errors.items()):
+                lines.append(f'travel_planner_span_errors_total{{span="{name}"}} {count}')
+            lines.append("# HELP travel_planner_tokens_total Tokens reported in completion usage blocks")
+            lines.append("# TYPE travel_planner_tokens_total counter")
+            for (operation, kind), count in sorted(self._tokens.items()):
+                lines.append(f'travel_planner_tokens_total{{operation="{operation}",kind="{kind.replace("_tokens", "")}"}} {count}')
+            for name, series in sorted(self._read_gauges().items()):
+                lines.append(f"# TYPE travel_planner_{name} gauge")
+                for labels, value in sorted(series.items()):
+                    lines.append(f"travel_planner_{name}{{{labels}}} {value}" if labels else f"travel_planner_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+class _SpanContext:
+    def __init__(self, name: str, attributes: Dict):
+        self.name = name
+        self.attributes = attributes
+
+    def __enter__(self) -> Span:
+        self.span = Span(self.name, _current_span.get(), self.attributes)
+        self._token = _current_span.set(self.span)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.spans.append(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        self.span.duration = time.perf_counter() - self.span.started
+        if exc_type is not None:
+            self.span.set(error=f"{exc_type.__name__}: {exc}")
+        try:
+            _current_span.reset(self._token)
+        except ValueError:
+            # Generator được tiếp tục ở context khác với lúc mở span
+            _current_span.set(self.span.parent)
+        metrics.observe(self.name, self.span.duration, exc_type is not None)
+        return False
+
+
+def span(name: str, **attributes):
+    """Time a block of code: `with span("weather.forecast") as s: ...`"""
+    if not TRACING_ENABLED:
+        return NOOP_SPAN
+    return _SpanContext(name, attributes)
+
+
+def current_span():
+    """The innermost open span, for attaching attributes such as cache hits"""
+    if not TRACING_ENABLED:
+        return NOOP_SPAN
+    return _current_span.get() or NOOP_SPAN
+
+
+def traced(name: str):
+    """Decorator that records each call of the function (or generator) as a span"""
+    def decorator(func):
+        if not TRACING_ENABLED:
+            return func
+
+        if inspect.isgeneratorfunction(func):
+            @functools.wraps(func)
+            def generator_wrapper(*args, **kwargs):
+                context = _SpanContext(name, {})
+                context.__enter__()
+                try:
+                    yield from func(*args, **kwargs)
+                except GeneratorExit:
+                    # Người dùng dừng đọc stream sớm: không phải lỗi
+                    context.__exit__(None, None, None)
+                    raise
+                except BaseException as e:
+                    context.__exit__(type(e), e, e.__traceback__)
+                    raise
+                context.__exit__(None, None, None)
+            return generator_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with _SpanContext(name, {}):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class _TraceContext:
+    def __init__(self, name: str):
+        self.name = name
+        self.trace: Optional[Trace] = None
+        self._token = None
+
+    def __enter__(self) -> Optional[Trace]:
+        if not TRACING_ENABLED:
+            return None
+        # Trace lồng nhau dùng chung trace bên ngoài
+        existing = _current_trace.get()
+        if existing is not None:
+            return existing
+        self.trace = Trace(self.name)
+        self._token = _current_trace.set(self.trace)
+        return self.trace
+
+    def __exit__(self, *exc):
+        if self._token is None:
+            return False
+        _current_trace.reset(self._token)
+        if TRACE_LOG_JSON:
+            print(json.dumps(self.trace.to_dict(), ensure_ascii=False), file=sys.stderr, flush=True)
+        return False
+
+
+def start_trace(name: str) -> _TraceContext:
+    """Collect the spans of one turn: `with start_trace("turn") as trace: ...`
+
+    Yields None when tracing is disabled.
+    """
+    return _TraceContext(name)
+
+
+def _metrics_handler():
+    # http.server chỉ được import khi bật endpoint metrics
+    from http.server import BaseHTTPRequestHandler
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.startswith("/metrics.json"):
+                body, content_type = json.dumps(metrics.snapshot()).encode("utf-8"), "application/json"
+            else:
+                body, content_type = metrics.render_prometheus().encode("utf-8"), "text/plain; version=0.0.4"
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    return MetricsHandler
+
+
+@lru_cache(maxsize=None)
+def start_metrics_server(port: int):
+    """Serve /metrics (Prometheus) and /metrics.json once per process"""
+    from http.server import ThreadingHTTPServer
+    server = ThreadingHTTPServer(("0.0.0.0", port), _metrics_handler())
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
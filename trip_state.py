@@ -0,0 +1,145 @@
+"""Structured trip state kept per chat session
+
+Follow-up turns only extract what changed ("make it 5 days", "switch to
+Hoi An") and merge it here, instead of re-extracting every requirement from
+the conversation. Downstream lookups are memoized against their inputs, so
+weather is only fetched again when the place or dates change and hotels
+when the place or budget change.
+"""
+import copy
+import json
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from plan_sections import split_plan
+
+# Fields describing the extraction itself rather than the trip
+META_FIELDS = ("original_input", "extraction")
+
+# Nested fields merged key by key instead of replaced
+NESTED_FIELDS = ("budget_details", "preferences")
+
+# Budget split that no longer applies once the total changes
+BUDGET_ALLOCATIONS = ("accommodation_budget", "food_budget", "activities_budget", "transportation_budget")
+
+# Requirement fields each downstream stage depends on
+STAGE_INPUTS = {
+    "weather": ("location", "start_date", "end_date", "weather_check", "legs"),
+    "hotels": ("location", "start_date", "end_date", "budget_details", "legs")
+}
+
+
+def _parse_date(value) -> Optional[datetime]:
+    try:
+        return datetime.strptime(value, "%Y-%m-%d")
+    except (TypeError, ValueError):
+        return None
+
+
+def trip_legs(requirements: Dict) -> List[Dict]:
+    """Destinations of the trip in visiting order, each with its start and end date
+
+    A trip without legs is one leg over the whole stay. When some leg has
+    no usable dates, the days of the trip are split evenly between the
+    legs in order (earlier legs get the extra days).
+    """
+    legs = [leg for leg in requirements.get("legs") or [] if isinstance(leg, dict) and leg.get("location")]
+    if not legs:
+        if not requirements.get("location"):
+            return []
+        return [{"location": requirements["location"], "start_date": requirements.get("start_date"),
+                 "end_date": requirements.get("end_date") or requirements.get("start_date")}]
+    if all(_parse_date(leg.get("start_date")) and _parse_date(leg.get("end_date")) for leg in legs):
+        return [{"location": leg["location"], "start_date": leg["start_date"], "end_date": leg["end_date"]}
+                for leg in legs]
+
+    start = _parse_date(requirements.get("start_date"))
+    end = _parse_date(requirements.get("end_date"))
+    if not start or not end or end < start:
+        return [{"location": leg["location"], "start_date": None, "end_date": None} for leg in legs]
+    days, extra = divmod((end - start).days + 1, len(legs))
+    result = []
+    for i, leg in enumerate(legs):
+        length = max(days + (1 if i < extra else 0), 1)
+        leg_end = min(start + timedelta(days=length - 1), end)
+        result.append({"location": leg["location"], "start_date": start.strftime("%Y-%m-%d"),
+                       "end_date": leg_end.strftime("%Y-%m-%d")})
+        start = min(leg_end + timedelta(days=1), end)
+    return result
+
+
+class TripState:
+    """Current trip requirements plus memoized results of the stages built on them"""
+
+    def __init__(self):
+        self.requirements: Dict = {}
+        # Last plan shown, split into days, with the requirements that produced it
+        self.plan: Optional[Dict] = None
+        self._stages: Dict[str, tuple] = {}
+
+    def is_empty(self) -> bool:
+        return not any(key not in META_FIELDS for key in self.requirements)
+
+    def trip_fields(self) -> Dict:
+        """Requirements without extraction metadata, e.g. for the extraction prompt"""
+        return {key: value for key, value in self.requirements.items() if key not in META_FIELDS}
+
+    def merge(self, delta: Dict) -> Set[str]:
+        """Apply the changed fields of a turn and return the names of those that changed"""
+        changed = set()
+        delta = {key: value for key, value in delta.items() if key not in META_FIELDS and value is not None}
+
+        old_start = _parse_date(self.requirements.get("start_date"))
+        new_start = _parse_date(delta.get("start_date"))
+        # Đổi ngày bắt đầu mà không nói ngày kết thúc: giữ nguyên độ dài chuyến đi
+        if "start_date" in delta and "end_date" not in delta:
+            old_end = _parse_date(self.requirements.get("end_date"))
+            if old_start and old_end and new_start:
+                delta["end_date"] = (new_start + (old_end - old_start)).strftime("%Y-%m-%d")
+
+        # Chuyến đi nhiều chặng: đổi sang một điểm đến thì bỏ các chặng, dời ngày thì dời cả các chặng
+        if self.requirements.get("legs") and "legs" not in delta:
+            if delta.get("location") not in (None, self.requirements.get("location")):
+                del self.requirements["legs"]
+                changed.add("legs")
+            elif old_start and new_start and new_start != old_start:
+                shift = new_start - old_start
+                delta["legs"] = [
+                    {**leg, **{field: (_parse_date(leg.get(field)) + shift).strftime("%Y-%m-%d")
+                               for field in ("start_date", "end_date") if _parse_date(leg.get(field))}}
+                    for leg in self.requirements["legs"]
+                ]
+
+        for key, value in delta.items():
+            if key in NESTED_FIELDS and isinstance(value, dict):
+                merged = dict(self.requirements.get(key) or {})
+                if key == "budget_details" and value.get("total") not in (None, merged.get("total")):
+                    for allocation in BUDGET_ALLOCATIONS:
+                        merged.pop(allocation, None)
+                merged.update({k: v for k, v in value.items() if v is not None})
+                value = merged
+            if self.requirements.get(key) != value:
+                self.requirements[key] = value
+                changed.add(key)
+        return changed
+
+    def record_plan(self, text: str, lang: str):
+        """Remember the plan shown to the user so the next change can edit it"""
+        self.plan = {"requirements": copy.deepcopy(self.trip_fields()), "lang": lang, "sections": split_plan(text)}
+
+    def stage(self, name: str, compute: Callable[[], Any], *extra_inputs, max_age: Optional[float] = None) -> Any:
+        """Result of a downstream stage, recomputed only when its inputs changed
+
+        extra_inputs are added to the requirement fields of STAGE_INPUTS, e.g.
+        the reply language for hotel text. max_age also expires the result.
+        """
+        inputs = json.dumps([self.requirements.get(field) for field in STAGE_INPUTS[name]] + list(extra_inputs),
+                            sort_keys=True, ensure_ascii=False)
+        cached = self._stages.get(name)
+        if cached is not None and cached[0] == inputs and (max_age is None or time.time() - cached[2] < max_age):
+            return cached[1]
+        value = compute()
+        self._stages[name] = (inputs, value, time.time())
+        return value
+
@@ -0,0 +1,118 @@
+"""Cached OpenWeather geocoding and forecast lookups"""
+from datetime import date, timedelta
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from cache import TTLCache
+from config import (
+    CACHE_DB_PATH,
+    WEATHER_API_BASE,
+    WEATHER_API_KEY,
+    WEATHER_CACHE_SIZE,
+    WEATHER_CACHE_TTL,
+    WEATHER_COORD_PRECISION,
+)
+from http_client import get_session
+from text_utils import normalize_text
+from tracing import current_span, traced
+
+
+def normalize_location(location: str) -> str:
+    """Normalize a location name so "Đà Nẵng", "da nang" and "Da Nang" match"""
+    return normalize_text(location)
+
+
+@lru_cache(maxsize=None)
+def get_geocode_cache() -> TTLCache:
+    """Coordinates of a place never change, so geocoding results do not expire"""
+    return TTLCache("geocode", maxsize=4096, ttl=None, db_path=CACHE_DB_PATH)
+
+
+@lru_cache(maxsize=None)
+def get_forecast_cache() -> TTLCache:
+    """Raw forecast payloads keyed by rounded coordinates"""
+    return TTLCache("forecast", maxsize=WEATHER_CACHE_SIZE, ttl=WEATHER_CACHE_TTL,
+                    db_path=CACHE_DB_PATH)
+
+
+@traced("weather.geocode")
+def geocode_location(location: str) -> Optional[Tuple[float, float]]:
+    """Get the coordinates of a location, or None if it cannot be found"""
+    key = normalize_location(location)
+    cached = get_geocode_cache().get(key)
+    current_span().set(cache_hit=cached is not None)
+    if cached is not None:
+        return cached[0], cached[1]
+
+    response = get_session().get(
+        f"{WEATHER_API_BASE}/geo/1.0/direct",
+        params={"q": location, "limit": 1, "appid": WEATHER_API_KEY}
+    )
+    response.raise_for_status()
+    location_data = response.json()
+    if not location_data:
+        return None
+
+    coords = (location_data[0]['lat'], location_data[0]['lon'])
+    get_geocode_cache().set(key, list(coords))
+    return coords
+
+
+@traced("weather.forecast")
+def fetch_forecast(lat: float, lon: float, refresh: bool = False) -> Dict:
+    """Get the raw 5-day / 3-hour forecast payload for the given coordinates
+
+    refresh skips the cache lookup and replaces the cached payload.
+    """
+    lat = round(lat, WEATHER_COORD_PRECISION)
+    lon = round(lon, WEATHER_COORD_PRECISION)
+    key = f"{lat},{lon}"
+    if not refresh:
+        cached = get_forecast_cache().get(key)
+        current_span().set(cache_hit=cached is not None)
+        if cached is not None:
+            return cached
+
+    response = get_session().get(
+        f"{WEATHER_API_BASE}/data/2.5/forecast",
+        params={"lat": lat, "lon": lon, "appid": WEATHER_API_KEY, "units": "metric"}
+    )
+    response.raise_for_status()
+    forecast_data = response.json()
+    # Chỉ lưu cache khi có dữ liệu dự báo hợp lệ
+    if forecast_data.get('list'):
+        get_forecast_cache().set(key, forecast_data)
+    return forecast_data
+
+
+def daily_forecasts(forecast_data: Dict, start_date: str, end_date: str) -> List[Dict]:
+    """Daily mean, min and max of a 3-hour forecast between two dates (inclusive)
+
+    Entries are bucketed by date in a single pass over the payload; days
+    outside the forecast window are left out.
+    """
+    start = date.fromisoformat(start_date)
+    days = (date.fromisoformat(end_date) - start).days + 1
+    wanted = {(start + timedelta(days=i)).isoformat() for i in range(days)}
+
+    # ngày -> [tổng nhiệt độ, số mốc, thấp nhất, cao nhất, mô tả của mốc đầu tiên]
+    buckets: Dict[str, list] = {}
+    for entry in forecast_data.get('list', []):
+        day = entry['dt_txt'][:10]
+        if day not in wanted:
+            continue
+        main = entry['main']
+        bucket = buckets.get(day)
+        if bucket is None:
+            buckets[day] = [main['temp'], 1, main['temp_min'], main['temp_max'], entry['weather'][0]['description']]
+            continue
+        bucket[0] += main['temp']
+        bucket[1] += 1
+        bucket[2] = min(bucket[2], main['temp_min'])
+        bucket[3] = max(bucket[3], main['temp_max'])
+
+    return [
+        {'date': day, 'temperature': round(total / count, 1), 'description': description,
+         'min_temp': low, 'max_temp': high}
+        for day, (total, count, low, high, description) in sorted(buckets.items())
+    ]